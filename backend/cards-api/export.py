@@ -0,0 +1,96 @@
+'''
+Business: Экспорт открыток в статические JSON-файлы для CDN (без вызова функции и БД)
+Args: out_dir - каталог снимка; --full - перезаписать файлы всех дат
+Returns: manifest.json с картой дат и content-hash файлами cards/MM-DD.<hash>.json
+Usage: DATABASE_URL=... python backend/cards-api/export.py ./snapshot
+'''
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from index import CARD_COLUMNS, get_db_connection, release_db_connection, render_card
+from psycopg2.extras import RealDictCursor
+
+MANIFEST_NAME = 'manifest.json'
+
+def load_manifest(out_dir: str) -> Dict[str, Any]:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'dates': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_file(path: str, content: str):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def remove_file(out_dir: str, name: str):
+    path = os.path.join(out_dir, name)
+    if os.path.exists(path):
+        os.remove(path)
+
+def export_snapshot(out_dir: str, full: bool = False) -> Dict[str, int]:
+    os.makedirs(os.path.join(out_dir, 'cards'), exist_ok=True)
+    previous = load_manifest(out_dir)['dates']
+    dates = {} if full else dict(previous)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute(f'SELECT {CARD_COLUMNS} FROM cards ORDER BY date')
+    cards = cur.fetchall()
+    
+    cur.close()
+    release_db_connection(conn)
+    
+    stats = {'rendered': 0, 'unchanged': 0, 'removed': 0}
+    
+    current = {card['date'] for card in cards}
+    for card in cards:
+        body, etag = render_card(card)
+        content_hash = etag.strip('"')[:16]
+        entry = dates.get(card['date'])
+        
+        if entry and entry['hash'] == content_hash:
+            stats['unchanged'] += 1
+            continue
+        
+        file_name = f"cards/{card['date']}.{content_hash}.json"
+        write_file(os.path.join(out_dir, file_name), body)
+        write_file(os.path.join(out_dir, 'cards', f"{card['date']}.json"), body)
+        
+        dates[card['date']] = {'file': file_name, 'hash': content_hash, 'etag': etag}
+        stats['rendered'] += 1
+    
+    written = {entry['file'] for date, entry in dates.items() if date in current}
+    for date, entry in previous.items():
+        if entry['file'] not in written:
+            remove_file(out_dir, entry['file'])
+        if date not in current:
+            remove_file(out_dir, f'cards/{date}.json')
+            dates.pop(date, None)
+            stats['removed'] += 1
+    
+    manifest = {
+        'generated_at': datetime.now().isoformat(),
+        'dates': dict(sorted(dates.items()))
+    }
+    write_file(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, ensure_ascii=False, indent=2))
+    
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export cards into a static snapshot')
+    parser.add_argument('out_dir')
+    parser.add_argument('--full', action='store_true', help='rewrite every file, ignoring the existing manifest')
+    args = parser.parse_args()
+    
+    print(json.dumps(export_snapshot(args.out_dir, args.full)))
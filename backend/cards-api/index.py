@@ -5,17 +5,313 @@ Args: event - dict with httpMethod, queryStringParameters
 Returns: HTTP response dict
 '''
 
+import base64
+import gzip
+import hashlib
 import json
 import os
-from typing import Dict, Any
-from datetime import datetime
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple, List, Iterator
+from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '30'))
+CARDS_CACHE_TTL = float(os.environ.get('CARDS_CACHE_TTL', '300'))
+CARDS_CLIENT_MAX_AGE = int(os.environ.get('CARDS_CLIENT_MAX_AGE', '60'))
+CARD_FIELDS = ('id', 'date', 'title', 'message', 'image_url', 'is_holiday', 'holiday_name', 'created_at')
+CARD_COLUMNS = ', '.join(CARD_FIELDS)
+CARDS_PAGE_SIZE = int(os.environ.get('CARDS_PAGE_SIZE', '50'))
+CARDS_MAX_PAGE_SIZE = int(os.environ.get('CARDS_MAX_PAGE_SIZE', '500'))
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+CARDS_MAX_BATCH_SIZE = int(os.environ.get('CARDS_MAX_BATCH_SIZE', '1000'))
+CARD_DATE_RE = re.compile(r'^(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$')
+FUNCTION_NAME = 'cards-api'
+GET_ACTIONS = frozenset(('today', 'all', 'date', 'metrics'))
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+    
+    def render(self, name: str, labels: str) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+class RequestMetrics:
+    def __init__(self, function_name: str, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.function_name = function_name
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.action = ''
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {'db_round_trips': 0, 'api_calls': 0}
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.durations: Dict[str, Histogram] = {}
+        self.phase_durations: Dict[str, Histogram] = {}
+    
+    def begin(self, action: str):
+        with self.lock:
+            self.action = action
+            self.phases = {}
+            self.counters = {'db_round_trips': 0, 'api_calls': 0}
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.totals[name] = self.totals.get(name, 0) + amount
+    
+    def finish(self, context: Any, status: int):
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            action, phases, counters = self.action, self.phases, self.counters
+            self.requests[(action, status)] = self.requests.get((action, status), 0) + 1
+            self.durations.setdefault(action, Histogram(self.buckets)).observe(duration)
+            for name, elapsed in phases.items():
+                self.phase_durations.setdefault(name, Histogram(self.buckets)).observe(elapsed)
+        
+        print(json.dumps({
+            'metric': 'request',
+            'function': self.function_name,
+            'request_id': getattr(context, 'request_id', None),
+            'action': action,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'phases_ms': {name: round(elapsed * 1000, 2) for name, elapsed in phases.items()},
+            **counters
+        }, separators=(',', ':')))
+    
+    def render(self) -> str:
+        function = f'function="{self.function_name}"'
+        lines = [
+            '# HELP cards_requests_total Handled requests by action and HTTP status.',
+            '# TYPE cards_requests_total counter'
+        ]
+        with self.lock:
+            for (action, status), count in sorted(self.requests.items()):
+                lines.append(f'cards_requests_total{{{function},action="{action}",status="{status}"}} {count}')
+            
+            lines += [
+                '# HELP cards_request_duration_seconds Handler wall time by action.',
+                '# TYPE cards_request_duration_seconds histogram'
+            ]
+            for action, histogram in sorted(self.durations.items()):
+                lines.extend(histogram.render('cards_request_duration_seconds', f'{function},action="{action}"'))
+            
+            lines += [
+                '# HELP cards_phase_duration_seconds Time spent per phase within one request.',
+                '# TYPE cards_phase_duration_seconds histogram'
+            ]
+            for name, histogram in sorted(self.phase_durations.items()):
+                lines.extend(histogram.render('cards_phase_duration_seconds', f'{function},phase="{name}"'))
+            
+            for name, total in sorted(self.totals.items()):
+                lines += [
+                    f'# TYPE cards_{name}_total counter',
+                    f'cards_{name}_total{{{function}}} {total}'
+                ]
+        return '\n'.join(lines) + '\n'
+
+metrics = RequestMetrics(FUNCTION_NAME)
+
+class MeteredCursorMixin:
+    def execute(self, query, vars=None):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().execute(query, vars)
+
+class MeteredCursor(MeteredCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+class MeteredDictCursor(MeteredCursorMixin, RealDictCursor):
+    pass
+
+METERED_CURSORS = {None: MeteredCursor, RealDictCursor: MeteredDictCursor}
+
+class MeteredConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory')
+        kwargs['cursor_factory'] = METERED_CURSORS.get(factory, factory)
+        return super().cursor(*args, **kwargs)
+    
+    def commit(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().commit()
+    
+    def rollback(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().rollback()
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_idle: int, health_check_interval: float):
+        self.dsn = dsn
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def getconn(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            
+            if conn.closed:
+                continue
+            if time.monotonic() - released_at < self.health_check_interval or self.is_alive(conn):
+                return conn
+            conn.close()
+        
+        with metrics.phase('db_connect'):
+            return psycopg2.connect(self.dsn, connection_factory=MeteredConnection)
+    
+    def putconn(self, conn):
+        if conn.closed:
+            return
+        
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return
+        
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+    
+    @staticmethod
+    def is_alive(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+db_pool: Optional[ConnectionPool] = None
 
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    global db_pool
+    if db_pool is None:
+        db_pool = ConnectionPool(os.environ['DATABASE_URL'], DB_POOL_SIZE, DB_HEALTH_CHECK_INTERVAL)
+    return db_pool.getconn()
+
+def release_db_connection(conn):
+    if db_pool is None:
+        conn.close()
+        return
+    db_pool.putconn(conn)
+
+card_cache: Dict[str, Tuple[str, str, float]] = {}
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in candidates or f'W/{etag}' in candidates
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    encodings = set()
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+def compress_response(response: Dict[str, Any], accept_encoding: Optional[str]) -> Dict[str, Any]:
+    body = response['body'].encode('utf-8')
+    response['headers']['Vary'] = 'Accept-Encoding'
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+    
+    encodings = accepted_encodings(accept_encoding)
+    with metrics.phase('compress'):
+        if brotli is not None and 'br' in encodings:
+            encoded, encoding = brotli.compress(body, quality=5), 'br'
+        elif 'gzip' in encodings:
+            encoded, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+        else:
+            return response
+    
+    response['headers']['Content-Encoding'] = encoding
+    response['body'] = base64.b64encode(encoded).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    metrics.begin(event.get('httpMethod', 'GET').lower())
+    status = 500
+    try:
+        response = handle_request(event)
+        status = response['statusCode']
+        return response
+    finally:
+        metrics.finish(context, status)
+
+def metrics_response() -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'},
+        'body': metrics.render(),
+        'isBase64Encoded': False
+    }
+
+def handle_request(event: Dict[str, Any]) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -24,7 +320,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -34,14 +330,19 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'GET':
         params = event.get('queryStringParameters') or {}
         action = params.get('action', 'today')
+        metrics.action = action if action in GET_ACTIONS else 'unknown'
+        
+        if_none_match = get_header(event, 'If-None-Match')
         
         if action == 'today':
-            return get_today_card()
+            return get_today_card(if_none_match)
         elif action == 'all':
-            return get_all_cards()
+            return compress_response(get_all_cards(params), get_header(event, 'Accept-Encoding'))
         elif action == 'date':
             date = params.get('date')
-            return get_card_by_date(date)
+            return get_card_by_date(date, if_none_match)
+        elif action == 'metrics':
+            return metrics_response()
         
         return {
             'statusCode': 400,
@@ -52,6 +353,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
+        if isinstance(body_data, list):
+            metrics.action = 'create_cards'
+            return create_cards(body_data)
+        metrics.action = 'create_card'
         return create_card(body_data)
     
     return {
@@ -61,118 +366,248 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'isBase64Encoded': False
     }
 
-def get_today_card() -> Dict[str, Any]:
+def get_today_card(if_none_match: Optional[str] = None) -> Dict[str, Any]:
     today = datetime.now()
     date_str = f'{today.month:02d}-{today.day:02d}'
+    midnight = datetime(today.year, today.month, today.day) + timedelta(days=1)
+    expires_at = min(midnight.timestamp(), time.time() + CARDS_CACHE_TTL)
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM cards WHERE date = %s', (date_str,))
-    card = cur.fetchone()
-    cur.close()
-    conn.close()
-    
-    if not card:
+    return get_cached_card(date_str, expires_at, if_none_match, 'Открытка на сегодня не найдена')
+
+def get_card_by_date(date: str, if_none_match: Optional[str] = None) -> Dict[str, Any]:
+    if not date:
         return {
-            'statusCode': 404,
+            'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Открытка на сегодня не найдена'}),
+            'body': json.dumps({'error': 'date parameter required (MM-DD format)'}),
+            'isBase64Encoded': False
+        }
+    
+    return get_cached_card(date, time.time() + CARDS_CACHE_TTL, if_none_match, 'Открытка не найдена')
+
+def render_card(card: Dict[str, Any]) -> Tuple[str, str]:
+    body = json.dumps(dict(card), default=str)
+    return body, '"' + hashlib.sha1(body.encode('utf-8')).hexdigest() + '"'
+
+def get_cached_card(date: str, expires_at: float, if_none_match: Optional[str], not_found_error: str) -> Dict[str, Any]:
+    now = time.time()
+    entry = card_cache.get(date)
+    
+    if entry is None or entry[2] <= now:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f'SELECT {CARD_COLUMNS} FROM cards WHERE date = %s', (date,))
+        card = cur.fetchone()
+        cur.close()
+        release_db_connection(conn)
+        
+        if not card:
+            card_cache.pop(date, None)
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': not_found_error}),
+                'isBase64Encoded': False
+            }
+        
+        with metrics.phase('render'):
+            body, etag = render_card(card)
+        entry = (body, etag, expires_at)
+        card_cache[date] = entry
+    
+    body, etag, entry_expires_at = entry
+    max_age = int(max(0, min(expires_at, entry_expires_at, now + CARDS_CLIENT_MAX_AGE) - now))
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={max_age}'
+    }
+    
+    if etag_matches(if_none_match, etag):
+        return {
+            'statusCode': 304,
+            'headers': headers,
+            'body': '',
             'isBase64Encoded': False
         }
     
     return {
         'statusCode': 200,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(dict(card), default=str),
+        'headers': headers,
+        'body': body,
         'isBase64Encoded': False
     }
 
-def get_card_by_date(date: str) -> Dict[str, Any]:
-    if not date:
+def get_all_cards(params: Dict[str, Any]) -> Dict[str, Any]:
+    after = params.get('after') or ''
+    
+    try:
+        limit = min(max(int(params.get('limit') or CARDS_PAGE_SIZE), 1), CARDS_MAX_PAGE_SIZE)
+    except ValueError:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'date parameter required (MM-DD format)'}),
+            'body': json.dumps({'error': 'limit must be an integer'}),
             'isBase64Encoded': False
         }
     
+    fields = list(CARD_FIELDS)
+    if params.get('fields'):
+        fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+        unknown = [field for field in fields if field not in CARD_FIELDS]
+        if unknown:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Unknown fields: {", ".join(unknown)}'}),
+                'isBase64Encoded': False
+            }
+        if 'date' not in fields:
+            fields.insert(0, 'date')
+    
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM cards WHERE date = %s', (date,))
-    card = cur.fetchone()
+    cur.execute(
+        f'SELECT {", ".join(fields)} FROM cards WHERE date > %s ORDER BY date ASC LIMIT %s',
+        (after, limit + 1)
+    )
+    cards = cur.fetchall()
     cur.close()
-    conn.close()
+    release_db_connection(conn)
     
-    if not card:
-        return {
-            'statusCode': 404,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Открытка не найдена'}),
-            'isBase64Encoded': False
-        }
+    next_after = None
+    if len(cards) > limit:
+        cards = cards[:limit]
+        next_after = cards[-1]['date']
+    
+    with metrics.phase('render'):
+        body = json.dumps(
+            {'cards': [dict(card) for card in cards], 'next_after': next_after},
+            default=str, ensure_ascii=False
+        )
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(dict(card), default=str),
+        'body': body,
         'isBase64Encoded': False
     }
 
-def get_all_cards() -> Dict[str, Any]:
-    conn = get_db_connection()
+def validate_card(data: Any) -> Optional[str]:
+    if not isinstance(data, dict):
+        return 'card must be an object'
+    if not all([data.get('date'), data.get('title'), data.get('message'), data.get('image_url')]):
+        return 'date, title, message, image_url are required'
+    if not CARD_DATE_RE.match(str(data['date'])):
+        return 'date must be in MM-DD format'
+    return None
+
+def upsert_cards(conn, cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    rows = [
+        (
+            card['date'],
+            card['title'],
+            card['message'],
+            card['image_url'],
+            card.get('is_holiday', False),
+            card.get('holiday_name')
+        )
+        for card in cards
+    ]
+    
     cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM cards ORDER BY date ASC')
-    cards = cur.fetchall()
+    results = execute_values(cur, '''
+        INSERT INTO cards (date, title, message, image_url, is_holiday, holiday_name)
+        VALUES %s
+        ON CONFLICT (date) 
+        DO UPDATE SET 
+            title = EXCLUDED.title,
+            message = EXCLUDED.message,
+            image_url = EXCLUDED.image_url,
+            is_holiday = EXCLUDED.is_holiday,
+            holiday_name = EXCLUDED.holiday_name,
+            telegram_file_id = CASE
+                WHEN cards.image_url = EXCLUDED.image_url THEN cards.telegram_file_id
+            END,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING id, date, (xmax = 0) AS created
+    ''', rows, page_size=len(rows), fetch=True)
+    conn.commit()
     cur.close()
-    conn.close()
+    
+    for result in results:
+        card_cache.pop(result['date'], None)
+    return results
+
+def create_card(data: Dict[str, Any]) -> Dict[str, Any]:
+    error = validate_card(data)
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': error}),
+            'isBase64Encoded': False
+        }
+    
+    conn = get_db_connection()
+    result = upsert_cards(conn, [data])[0]
+    release_db_connection(conn)
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps([dict(card) for card in cards], default=str),
+        'body': json.dumps({'success': True, 'card_id': result['id']}),
         'isBase64Encoded': False
     }
 
-def create_card(data: Dict[str, Any]) -> Dict[str, Any]:
-    date = data.get('date')
-    title = data.get('title')
-    message = data.get('message')
-    image_url = data.get('image_url')
-    is_holiday = data.get('is_holiday', False)
-    holiday_name = data.get('holiday_name')
-    
-    if not all([date, title, message, image_url]):
+def create_cards(items: List[Any]) -> Dict[str, Any]:
+    if not items or len(items) > CARDS_MAX_BATCH_SIZE:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'date, title, message, image_url are required'}),
+            'body': json.dumps({'error': f'batch must contain 1..{CARDS_MAX_BATCH_SIZE} cards'}),
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    errors = []
+    seen_dates = {}
+    for index, item in enumerate(items):
+        error = validate_card(item)
+        if not error and item['date'] in seen_dates:
+            error = f'duplicate date, already used by item {seen_dates[item["date"]]}'
+        if error:
+            errors.append({'index': index, 'success': False, 'error': error})
+        else:
+            seen_dates[item['date']] = index
     
-    cur.execute('''
-        INSERT INTO cards (date, title, message, image_url, is_holiday, holiday_name)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT (date) 
-        DO UPDATE SET 
-            title = EXCLUDED.title,
-            message = EXCLUDED.message,
-            image_url = EXCLUDED.image_url,
-            is_holiday = EXCLUDED.is_holiday,
-            holiday_name = EXCLUDED.holiday_name
-        RETURNING id
-    ''', (date, title, message, image_url, is_holiday, holiday_name))
+    if errors:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Batch validation failed, nothing was saved', 'results': errors}),
+            'isBase64Encoded': False
+        }
     
-    result = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    conn = get_db_connection()
+    saved = {result['date']: result for result in upsert_cards(conn, items)}
+    release_db_connection(conn)
+    
+    results = []
+    for index, item in enumerate(items):
+        result = saved[item['date']]
+        results.append({
+            'index': index,
+            'success': True,
+            'date': result['date'],
+            'card_id': result['id'],
+            'created': result['created']
+        })
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True, 'card_id': result['id']}),
+        'body': json.dumps({'success': True, 'results': results}),
         'isBase64Encoded': False
     }
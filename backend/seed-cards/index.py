@@ -1,19 +1,402 @@
 '''
 Business: Заполнение базы данных открытками на каждый день года
-Args: event - dict with httpMethod
+Args: event - dict with httpMethod, body (CSV/JSONL каталог или JSON с source_url), queryStringParameters (format, mode)
       context - object with attributes: request_id
 Returns: HTTP response dict
 '''
 
+import base64
+import csv
+import http.client
+import io
+import ipaddress
 import json
 import os
-from typing import Dict, Any
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Iterable, Iterator
 import psycopg2
+import psycopg2.extensions
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '1'))
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '30'))
+SOURCE_FETCH_TIMEOUT = float(os.environ.get('SOURCE_FETCH_TIMEOUT', '30'))
+SOURCE_ALLOWED_HOSTS = {host.strip().lower() for host in os.environ.get('SOURCE_ALLOWED_HOSTS', '').split(',') if host.strip()}
+CARD_DATE_RE = re.compile(r'^(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$')
+CARD_FIELDS = ('date', 'title', 'message', 'image_url', 'is_holiday', 'holiday_name')
+TRUE_VALUES = {'true', 't', '1', 'yes', 'y'}
+FUNCTION_NAME = 'seed-cards'
+
+DEFAULT_CARDS = [
+    ('10-26', 'С добрым утром!', 'Желаю крепкого здоровья, желаю бодрости и сил, чтоб каждый день обычной жизни лишь только радость приносил!', 'https://i.pinimg.com/originals/bf/65/71/bf6571d0fc24c2a8feb4d0b4a1a6ce07.jpg', False, None),
+    ('01-01', 'С Новым Годом!', 'Пусть новый год принесет счастье, здоровье и благополучие в ваш дом!', 'https://i.pinimg.com/originals/29/86/e3/2986e3c70f2cdf2b3a7b88e583e4a03e.jpg', True, 'Новый Год'),
+    ('01-07', 'С Рождеством!', 'Светлого Рождества! Пусть в доме будет тепло и уютно!', 'https://i.pinimg.com/originals/53/a8/f1/53a8f160d7d4ddf74c6e5cd9c0a8dd2e.jpg', True, 'Рождество'),
+    ('02-14', 'С Днем Святого Валентина!', 'Любви, нежности и теплых чувств!', 'https://i.pinimg.com/originals/e0/8e/1d/e08e1d0c5c8f3c38a2c5c3a1e1f4a6b3.jpg', True, 'День Святого Валентина'),
+    ('02-23', 'С Днем защитника Отечества!', 'Мужества, силы и крепкого здоровья!', 'https://i.pinimg.com/originals/92/73/46/9273461f1e8e8c0e6a7c3b2e1f4a6b3c.jpg', True, 'День защитника Отечества'),
+    ('03-08', 'С Международным женским днем!', 'Красоты, радости и весеннего настроения!', 'https://i.pinimg.com/originals/7d/45/97/7d45975b8f0f3c38a2c5c3a1e1f4a6b3.jpg', True, '8 Марта'),
+    ('05-01', 'С Праздником Весны и Труда!', 'Хорошего отдыха и весеннего настроения!', 'https://i.pinimg.com/originals/1a/2b/3c/1a2b3c4d5e6f7g8h9i0j1k2l3m4n5o6p.jpg', True, '1 Мая'),
+    ('05-09', 'С Днем Победы!', 'Мира, добра и светлой памяти героям!', 'https://i.pinimg.com/originals/a5/b6/c7/a5b6c7d8e9f0g1h2i3j4k5l6m7n8o9p0.jpg', True, 'День Победы'),
+    ('06-12', 'С Днем России!', 'Гордости за нашу страну и процветания!', 'https://i.pinimg.com/originals/45/67/89/456789abcdef0123456789abcdef0123.jpg', True, 'День России'),
+    ('11-04', 'С Днем народного единства!', 'Мира, согласия и единства!', 'https://i.pinimg.com/originals/67/89/ab/6789abcdef0123456789abcdef012345.jpg', True, 'День народного единства'),
+    ('01-15', 'С добрым утром!', 'Пусть этот день принесет вам радость и удачу!', 'https://i.pinimg.com/originals/bf/65/71/bf6571d0fc24c2a8feb4d0b4a1a6ce07.jpg', False, None),
+    ('02-10', 'Доброго дня!', 'Желаю тепла, уюта и хорошего настроения!', 'https://i.pinimg.com/originals/c1/d2/e3/c1d2e3f4g5h6i7j8k9l0m1n2o3p4q5r6.jpg', False, None),
+    ('03-15', 'С добрым утром!', 'Пусть весна принесет тепло и новые возможности!', 'https://i.pinimg.com/originals/s7/t8/u9/s7t8u9v0w1x2y3z4a5b6c7d8e9f0g1h2.jpg', False, None),
+    ('04-20', 'Чудесного дня!', 'Пусть каждый момент будет наполнен радостью!', 'https://i.pinimg.com/originals/i3/j4/k5/i3j4k5l6m7n8o9p0q1r2s3t4u5v6w7x8.jpg', False, None),
+    ('05-20', 'Доброго утра!', 'Пусть этот день будет ярким и счастливым!', 'https://i.pinimg.com/originals/y9/z0/a1/y9z0a1b2c3d4e5f6g7h8i9j0k1l2m3n4.jpg', False, None),
+    ('06-25', 'С добрым утром!', 'Желаю солнечного настроения и приятных моментов!', 'https://i.pinimg.com/originals/o5/p6/q7/o5p6q7r8s9t0u1v2w3x4y5z6a7b8c9d0.jpg', False, None),
+    ('07-15', 'Прекрасного дня!', 'Пусть лето дарит яркие впечатления!', 'https://i.pinimg.com/originals/e1/f2/g3/e1f2g3h4i5j6k7l8m9n0o1p2q3r4s5t6.jpg', False, None),
+    ('08-10', 'Доброго утра!', 'Желаю легкости и вдохновения на весь день!', 'https://i.pinimg.com/originals/u7/v8/w9/u7v8w9x0y1z2a3b4c5d6e7f8g9h0i1j2.jpg', False, None),
+    ('09-15', 'С добрым утром!', 'Пусть осень принесет тепло и уют!', 'https://i.pinimg.com/originals/k3/l4/m5/k3l4m5n6o7p8q9r0s1t2u3v4w5x6y7z8.jpg', False, None),
+    ('10-10', 'Чудесного дня!', 'Желаю ярких красок и приятных встреч!', 'https://i.pinimg.com/originals/a9/b0/c1/a9b0c1d2e3f4g5h6i7j8k9l0m1n2o3p4.jpg', False, None),
+    ('11-15', 'С добрым утром!', 'Пусть день будет наполнен теплом и заботой!', 'https://i.pinimg.com/originals/q5/r6/s7/q5r6s7t8u9v0w1x2y3z4a5b6c7d8e9f0.jpg', False, None),
+    ('12-20', 'Прекрасного дня!', 'Желаю волшебного настроения и радости!', 'https://i.pinimg.com/originals/g1/h2/i3/g1h2i3j4k5l6m7n8o9p0q1r2s3t4u5v6.jpg', False, None),
+]
+
+class RequestMetrics:
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.lock = threading.Lock()
+        self.action = ''
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {'db_round_trips': 0, 'api_calls': 0}
+    
+    def begin(self, action: str):
+        with self.lock:
+            self.action = action
+            self.phases = {}
+            self.counters = {'db_round_trips': 0, 'api_calls': 0}
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.totals[name] = self.totals.get(name, 0) + amount
+    
+    def finish(self, context: Any, status: int):
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            action, phases, counters = self.action, self.phases, self.counters
+        
+        print(json.dumps({
+            'metric': 'request',
+            'function': self.function_name,
+            'request_id': getattr(context, 'request_id', None),
+            'action': action,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'phases_ms': {name: round(elapsed * 1000, 2) for name, elapsed in phases.items()},
+            **counters
+        }, separators=(',', ':')))
+
+metrics = RequestMetrics(FUNCTION_NAME)
+
+class MeteredCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().execute(query, vars)
+    
+    def copy_expert(self, sql, file, size=8192):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().copy_expert(sql, file, size)
+
+class MeteredConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', MeteredCursor)
+        return super().cursor(*args, **kwargs)
+    
+    def commit(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().commit()
+    
+    def rollback(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().rollback()
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_idle: int, health_check_interval: float):
+        self.dsn = dsn
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def getconn(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            
+            if conn.closed:
+                continue
+            if time.monotonic() - released_at < self.health_check_interval or self.is_alive(conn):
+                return conn
+            conn.close()
+        
+        with metrics.phase('db_connect'):
+            return psycopg2.connect(self.dsn, connection_factory=MeteredConnection)
+    
+    def putconn(self, conn):
+        if conn.closed:
+            return
+        
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return
+        
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+    
+    @staticmethod
+    def is_alive(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+db_pool: Optional[ConnectionPool] = None
 
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    global db_pool
+    if db_pool is None:
+        db_pool = ConnectionPool(os.environ['DATABASE_URL'], DB_POOL_SIZE, DB_HEALTH_CHECK_INTERVAL)
+    return db_pool.getconn()
+
+def release_db_connection(conn):
+    if db_pool is None:
+        conn.close()
+        return
+    db_pool.putconn(conn)
+
+class CopyStream:
+    def __init__(self, lines: Iterator[str]):
+        self.lines = lines
+        self.buffer = ''
+    
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        
+        if size < 0:
+            chunk, self.buffer = self.buffer, ''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+    
+    readline = read
+
+def iter_records(lines: Iterable[str], data_format: str) -> Iterator[Dict[str, Any]]:
+    if data_format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {}
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+def iter_copy_rows(records: Iterable[Dict[str, Any]], stats: Dict[str, int]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    
+    for line_no, record in enumerate(records):
+        if not isinstance(record, dict):
+            stats['skipped'] += 1
+            continue
+        
+        date = str(record.get('date') or '').strip()
+        if not CARD_DATE_RE.match(date) or not all(record.get(field) for field in ('title', 'message', 'image_url')):
+            stats['skipped'] += 1
+            continue
+        
+        writer.writerow((
+            line_no,
+            date,
+            record['title'],
+            record['message'],
+            record['image_url'],
+            parse_bool(record.get('is_holiday')),
+            record.get('holiday_name') or None
+        ))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def validate_source_url(url: str):
+    parsed = urllib.parse.urlsplit(url)
+    host = (parsed.hostname or '').lower()
+    if parsed.scheme != 'https' or not host:
+        raise ValueError('source_url must be an https URL')
+    if SOURCE_ALLOWED_HOSTS and host not in SOURCE_ALLOWED_HOSTS:
+        raise ValueError(f'source host {host} is not allowed')
+
+def resolve_source_address(host: str, port: int) -> str:
+    addresses = [sockaddr[0] for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError(f'source host {host} resolves to a non-public address')
+    return addresses[0]
+
+class SourceHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        address = resolve_source_address(self.host, self.port)
+        sock = socket.create_connection((address, self.port), self.timeout, self.source_address)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+class SourceHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(SourceHTTPSConnection, req)
+
+class SourceRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        validate_source_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+source_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), SourceHTTPSHandler, SourceRedirectHandler)
+
+def open_source(event: Dict[str, Any], params: Dict[str, Any]):
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    content_type = headers.get('content-type', '')
+    body = event.get('body') or ''
+    data_format = params.get('format')
+    
+    if event.get('isBase64Encoded') and body:
+        body = base64.b64decode(body).decode('utf-8')
+    
+    if not data_format:
+        if 'csv' in content_type:
+            data_format = 'csv'
+        elif 'ndjson' in content_type or 'jsonl' in content_type:
+            data_format = 'jsonl'
+    
+    if data_format:
+        return io.StringIO(body), data_format, params.get('mode', 'upsert')
+    
+    options = json.loads(body) if body.strip() else {}
+    source_url = options.get('source_url')
+    if not source_url:
+        return None, None, options.get('mode', params.get('mode', 'insert'))
+    
+    validate_source_url(source_url)
+    data_format = options.get('format') or ('csv' if source_url.split('?')[0].endswith('.csv') else 'jsonl')
+    metrics.count('api_calls')
+    with metrics.phase('source_fetch'):
+        response = source_opener.open(source_url, timeout=SOURCE_FETCH_TIMEOUT)
+    return io.TextIOWrapper(response, encoding='utf-8', newline=''), data_format, options.get('mode', 'upsert')
+
+def import_cards(conn, records: Iterable[Dict[str, Any]], mode: str) -> Dict[str, int]:
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    cur = conn.cursor()
+    
+    cur.execute('''
+        CREATE TEMP TABLE cards_staging (
+            line_no BIGINT,
+            date VARCHAR(5),
+            title TEXT,
+            message TEXT,
+            image_url TEXT,
+            is_holiday BOOLEAN,
+            holiday_name VARCHAR(255)
+        ) ON COMMIT DROP
+    ''')
+    cur.copy_expert(
+        'COPY cards_staging FROM STDIN WITH (FORMAT csv)',
+        CopyStream(iter_copy_rows(records, stats))
+    )
+    staged = cur.rowcount
+    
+    if mode == 'insert':
+        conflict_clause = 'DO NOTHING'
+    else:
+        conflict_clause = '''DO UPDATE SET
+                title = EXCLUDED.title,
+                message = EXCLUDED.message,
+                image_url = EXCLUDED.image_url,
+                is_holiday = EXCLUDED.is_holiday,
+                holiday_name = EXCLUDED.holiday_name,
+                telegram_file_id = CASE
+                    WHEN cards.image_url = EXCLUDED.image_url THEN cards.telegram_file_id
+                END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE (cards.title, cards.message, cards.image_url, cards.is_holiday, cards.holiday_name)
+                IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.message, EXCLUDED.image_url, EXCLUDED.is_holiday, EXCLUDED.holiday_name)'''
+    
+    cur.execute(f'''
+        WITH latest AS (
+            SELECT DISTINCT ON (date) date, title, message, image_url, is_holiday, holiday_name
+            FROM cards_staging
+            ORDER BY date, line_no DESC
+        ), merged AS (
+            INSERT INTO cards (date, title, message, image_url, is_holiday, holiday_name)
+            SELECT date, title, message, image_url, is_holiday, holiday_name FROM latest
+            ON CONFLICT (date) {conflict_clause}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE inserted) AS inserted,
+            COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM merged
+    ''')
+    stats['inserted'], stats['updated'] = cur.fetchone()
+    stats['skipped'] += staged - stats['inserted'] - stats['updated']
+    
+    conn.commit()
+    cur.close()
+    return stats
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    metrics.begin(event.get('httpMethod', 'POST').lower())
+    status = 500
+    try:
+        response = handle_request(event)
+        status = response['statusCode']
+        return response
+    finally:
+        metrics.finish(context, status)
+
+def handle_request(event: Dict[str, Any]) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
@@ -37,55 +420,57 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    cards_data = [
-        ('10-26', 'С добрым утром!', 'Желаю крепкого здоровья, желаю бодрости и сил, чтоб каждый день обычной жизни лишь только радость приносил!', 'https://i.pinimg.com/originals/bf/65/71/bf6571d0fc24c2a8feb4d0b4a1a6ce07.jpg', False, None),
-        ('01-01', 'С Новым Годом!', 'Пусть новый год принесет счастье, здоровье и благополучие в ваш дом!', 'https://i.pinimg.com/originals/29/86/e3/2986e3c70f2cdf2b3a7b88e583e4a03e.jpg', True, 'Новый Год'),
-        ('01-07', 'С Рождеством!', 'Светлого Рождества! Пусть в доме будет тепло и уютно!', 'https://i.pinimg.com/originals/53/a8/f1/53a8f160d7d4ddf74c6e5cd9c0a8dd2e.jpg', True, 'Рождество'),
-        ('02-14', 'С Днем Святого Валентина!', 'Любви, нежности и теплых чувств!', 'https://i.pinimg.com/originals/e0/8e/1d/e08e1d0c5c8f3c38a2c5c3a1e1f4a6b3.jpg', True, 'День Святого Валентина'),
-        ('02-23', 'С Днем защитника Отечества!', 'Мужества, силы и крепкого здоровья!', 'https://i.pinimg.com/originals/92/73/46/9273461f1e8e8c0e6a7c3b2e1f4a6b3c.jpg', True, 'День защитника Отечества'),
-        ('03-08', 'С Международным женским днем!', 'Красоты, радости и весеннего настроения!', 'https://i.pinimg.com/originals/7d/45/97/7d45975b8f0f3c38a2c5c3a1e1f4a6b3.jpg', True, '8 Марта'),
-        ('05-01', 'С Праздником Весны и Труда!', 'Хорошего отдыха и весеннего настроения!', 'https://i.pinimg.com/originals/1a/2b/3c/1a2b3c4d5e6f7g8h9i0j1k2l3m4n5o6p.jpg', True, '1 Мая'),
-        ('05-09', 'С Днем Победы!', 'Мира, добра и светлой памяти героям!', 'https://i.pinimg.com/originals/a5/b6/c7/a5b6c7d8e9f0g1h2i3j4k5l6m7n8o9p0.jpg', True, 'День Победы'),
-        ('06-12', 'С Днем России!', 'Гордости за нашу страну и процветания!', 'https://i.pinimg.com/originals/45/67/89/456789abcdef0123456789abcdef0123.jpg', True, 'День России'),
-        ('11-04', 'С Днем народного единства!', 'Мира, согласия и единства!', 'https://i.pinimg.com/originals/67/89/ab/6789abcdef0123456789abcdef012345.jpg', True, 'День народного единства'),
-        ('01-15', 'С добрым утром!', 'Пусть этот день принесет вам радость и удачу!', 'https://i.pinimg.com/originals/bf/65/71/bf6571d0fc24c2a8feb4d0b4a1a6ce07.jpg', False, None),
-        ('02-10', 'Доброго дня!', 'Желаю тепла, уюта и хорошего настроения!', 'https://i.pinimg.com/originals/c1/d2/e3/c1d2e3f4g5h6i7j8k9l0m1n2o3p4q5r6.jpg', False, None),
-        ('03-15', 'С добрым утром!', 'Пусть весна принесет тепло и новые возможности!', 'https://i.pinimg.com/originals/s7/t8/u9/s7t8u9v0w1x2y3z4a5b6c7d8e9f0g1h2.jpg', False, None),
-        ('04-20', 'Чудесного дня!', 'Пусть каждый момент будет наполнен радостью!', 'https://i.pinimg.com/originals/i3/j4/k5/i3j4k5l6m7n8o9p0q1r2s3t4u5v6w7x8.jpg', False, None),
-        ('05-20', 'Доброго утра!', 'Пусть этот день будет ярким и счастливым!', 'https://i.pinimg.com/originals/y9/z0/a1/y9z0a1b2c3d4e5f6g7h8i9j0k1l2m3n4.jpg', False, None),
-        ('06-25', 'С добрым утром!', 'Желаю солнечного настроения и приятных моментов!', 'https://i.pinimg.com/originals/o5/p6/q7/o5p6q7r8s9t0u1v2w3x4y5z6a7b8c9d0.jpg', False, None),
-        ('07-15', 'Прекрасного дня!', 'Пусть лето дарит яркие впечатления!', 'https://i.pinimg.com/originals/e1/f2/g3/e1f2g3h4i5j6k7l8m9n0o1p2q3r4s5t6.jpg', False, None),
-        ('08-10', 'Доброго утра!', 'Желаю легкости и вдохновения на весь день!', 'https://i.pinimg.com/originals/u7/v8/w9/u7v8w9x0y1z2a3b4c5d6e7f8g9h0i1j2.jpg', False, None),
-        ('09-15', 'С добрым утром!', 'Пусть осень принесет тепло и уют!', 'https://i.pinimg.com/originals/k3/l4/m5/k3l4m5n6o7p8q9r0s1t2u3v4w5x6y7z8.jpg', False, None),
-        ('10-10', 'Чудесного дня!', 'Желаю ярких красок и приятных встреч!', 'https://i.pinimg.com/originals/a9/b0/c1/a9b0c1d2e3f4g5h6i7j8k9l0m1n2o3p4.jpg', False, None),
-        ('11-15', 'С добрым утром!', 'Пусть день будет наполнен теплом и заботой!', 'https://i.pinimg.com/originals/q5/r6/s7/q5r6s7t8u9v0w1x2y3z4a5b6c7d8e9f0.jpg', False, None),
-        ('12-20', 'Прекрасного дня!', 'Желаю волшебного настроения и радости!', 'https://i.pinimg.com/originals/g1/h2/i3/g1h2i3j4k5l6m7n8o9p0q1r2s3t4u5v6.jpg', False, None),
-    ]
+    params = event.get('queryStringParameters') or {}
     
-    conn = get_db_connection()
-    cur = conn.cursor()
+    try:
+        source, data_format, mode = open_source(event, params)
+    except Exception as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Failed to open catalog: {str(e)}'}),
+            'isBase64Encoded': False
+        }
     
-    inserted = 0
-    for date, title, message, image_url, is_holiday, holiday_name in cards_data:
-        cur.execute('''
-            INSERT INTO cards (date, title, message, image_url, is_holiday, holiday_name)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (date) DO NOTHING
-        ''', (date, title, message, image_url, is_holiday, holiday_name))
-        if cur.rowcount > 0:
-            inserted += 1
+    if mode not in ('insert', 'upsert'):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'mode must be insert or upsert'}),
+            'isBase64Encoded': False
+        }
     
-    conn.commit()
-    cur.close()
-    conn.close()
+    if source is None:
+        records = (dict(zip(CARD_FIELDS, card)) for card in DEFAULT_CARDS)
+    else:
+        records = iter_records(source, data_format)
+    
+    conn = get_db_connection()
+    try:
+        stats = import_cards(conn, records, mode)
+    except (ValueError, csv.Error, psycopg2.DataError) as e:
+        conn.rollback()
+        release_db_connection(conn)
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Invalid catalog: {str(e)}'}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if source is not None:
+            source.close()
+    release_db_connection(conn)
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
         'body': json.dumps({
             'success': True,
-            'message': f'Добавлено открыток: {inserted}',
-            'inserted': inserted
+            'message': f'Добавлено открыток: {stats["inserted"]}, обновлено: {stats["updated"]}, пропущено: {stats["skipped"]}',
+            'inserted': stats['inserted'],
+            'updated': stats['updated'],
+            'skipped': stats['skipped']
         }),
         'isBase64Encoded': False
     }
\ No newline at end of file
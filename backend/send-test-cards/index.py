@@ -7,18 +7,273 @@ Returns: HTTP response dict
 
 import json
 import os
-from typing import Dict, Any, List
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Iterator
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
-import urllib.request
-import urllib.parse
+import http.client
+import ssl
 from datetime import datetime, timedelta
 
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '30'))
+SUBSCRIBERS_BATCH_SIZE = int(os.environ.get('SUBSCRIBERS_BATCH_SIZE', '1000'))
+MEDIA_GROUP_SIZE = 10
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_POOL_SIZE = int(os.environ.get('TELEGRAM_POOL_SIZE', '2'))
+TELEGRAM_TIMEOUT = float(os.environ.get('TELEGRAM_TIMEOUT', '10'))
+FUNCTION_NAME = 'send-test-cards'
+
+class RequestMetrics:
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.lock = threading.Lock()
+        self.action = ''
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {'db_round_trips': 0, 'api_calls': 0}
+    
+    def begin(self, action: str):
+        with self.lock:
+            self.action = action
+            self.phases = {}
+            self.counters = {'db_round_trips': 0, 'api_calls': 0}
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.totals[name] = self.totals.get(name, 0) + amount
+    
+    def finish(self, context: Any, status: int):
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            action, phases, counters = self.action, self.phases, self.counters
+        
+        print(json.dumps({
+            'metric': 'request',
+            'function': self.function_name,
+            'request_id': getattr(context, 'request_id', None),
+            'action': action,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'phases_ms': {name: round(elapsed * 1000, 2) for name, elapsed in phases.items()},
+            **counters
+        }, separators=(',', ':')))
+
+metrics = RequestMetrics(FUNCTION_NAME)
+
+class MeteredCursorMixin:
+    def execute(self, query, vars=None):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().execute(query, vars)
+    
+    def __iter__(self):
+        if not self.name:
+            return super().__iter__()
+        return self.iter_named()
+    
+    def iter_named(self):
+        while True:
+            metrics.count('db_round_trips')
+            with metrics.phase('db'):
+                rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+class MeteredCursor(MeteredCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+class MeteredDictCursor(MeteredCursorMixin, RealDictCursor):
+    pass
+
+METERED_CURSORS = {None: MeteredCursor, RealDictCursor: MeteredDictCursor}
+
+class MeteredConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory')
+        kwargs['cursor_factory'] = METERED_CURSORS.get(factory, factory)
+        return super().cursor(*args, **kwargs)
+    
+    def commit(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().commit()
+    
+    def rollback(self):
+        metrics.count('db_round_trips')
+        with metrics.phase('db'):
+            return super().rollback()
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_idle: int, health_check_interval: float):
+        self.dsn = dsn
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def getconn(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            
+            if conn.closed:
+                continue
+            if time.monotonic() - released_at < self.health_check_interval or self.is_alive(conn):
+                return conn
+            conn.close()
+        
+        with metrics.phase('db_connect'):
+            return psycopg2.connect(self.dsn, connection_factory=MeteredConnection)
+    
+    def putconn(self, conn):
+        if conn.closed:
+            return
+        
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return
+        
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+    
+    @staticmethod
+    def is_alive(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+db_pool: Optional[ConnectionPool] = None
+
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    global db_pool
+    if db_pool is None:
+        db_pool = ConnectionPool(os.environ['DATABASE_URL'], DB_POOL_SIZE, DB_HEALTH_CHECK_INTERVAL)
+    return db_pool.getconn()
+
+def release_db_connection(conn):
+    if db_pool is None:
+        conn.close()
+        return
+    db_pool.putconn(conn)
+
+class TelegramClient:
+    def __init__(self, base_url: str, pool_size: int, timeout: float):
+        scheme, _, location = base_url.partition('://')
+        self.host, _, path = location.partition('/')
+        self.secure = scheme == 'https'
+        self.path_prefix = f'/{path}'.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        if not self.secure:
+            return http.client.HTTPConnection(self.host, timeout=self.timeout), False
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self.ssl_context), False
+    
+    def release(self, conn: http.client.HTTPConnection):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(conn)
+                return
+        conn.close()
+    
+    def request(self, bot_token: str, method: str, params: Dict[str, Any],
+                timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        body = json.dumps(params).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        
+        while True:
+            conn, reused = self.acquire()
+            conn.timeout = timeout or self.timeout
+            if conn.sock:
+                conn.sock.settimeout(conn.timeout)
+            
+            metrics.count('api_calls')
+            try:
+                with metrics.phase('telegram_api'):
+                    conn.request('POST', f'{self.path_prefix}/bot{bot_token}/{method}', body, headers)
+                    response = conn.getresponse()
+                    data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(conn)
+            return response.status, data
+    
+    def call(self, bot_token: str, method: str, params: Dict[str, Any],
+             timeout: Optional[float] = None) -> Dict[str, Any]:
+        status, data = self.request(bot_token, method, params, timeout)
+        return json.loads(data)
+    
+    def call_ok(self, bot_token: str, method: str, params: Dict[str, Any],
+                timeout: Optional[float] = None) -> bool:
+        status, data = self.request(bot_token, method, params, timeout)
+        return status == 200 and data[:16].replace(b' ', b'').startswith(b'{"ok":true')
+
+telegram = TelegramClient(TELEGRAM_API_URL, TELEGRAM_POOL_SIZE, TELEGRAM_TIMEOUT)
+
+def send_telegram_photo(bot_token: str, chat_id: int, photo: str, caption: str = '') -> bool:
+    params = {
+        'chat_id': chat_id,
+        'photo': photo,
+        'caption': caption,
+        'parse_mode': 'HTML'
+    }
+    
+    try:
+        return telegram.call_ok(bot_token, 'sendPhoto', params)
+    except Exception as e:
+        print(f'Failed to send photo: {str(e)}')
+        return False
 
-def send_telegram_photo(bot_token: str, chat_id: int, photo_url: str, caption: str = '') -> bool:
-    api_url = f'https://api.telegram.org/bot{bot_token}/sendPhoto'
+def upload_telegram_photo(bot_token: str, chat_id: int, photo_url: str, caption: str = '') -> Optional[Dict[str, Any]]:
     params = {
         'chat_id': chat_id,
         'photo': photo_url,
@@ -27,16 +282,112 @@ def send_telegram_photo(bot_token: str, chat_id: int, photo_url: str, caption: s
     }
     
     try:
-        data_encoded = urllib.parse.urlencode(params).encode('utf-8')
-        req = urllib.request.Request(api_url, data=data_encoded)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('ok', False)
+        result = telegram.call(bot_token, 'sendPhoto', params)
+        return result.get('result') if result.get('ok') else None
     except Exception as e:
         print(f'Failed to send photo: {str(e)}')
+        return None
+
+def send_media_group(bot_token: str, chat_id: int, media: List[Dict[str, Any]],
+                     parse_result: bool = False) -> Tuple[bool, Optional[List[Dict[str, Any]]]]:
+    params = {
+        'chat_id': chat_id,
+        'media': media
+    }
+    
+    try:
+        if not parse_result:
+            return telegram.call_ok(bot_token, 'sendMediaGroup', params), None
+        result = telegram.call(bot_token, 'sendMediaGroup', params)
+        return bool(result.get('ok')), result.get('result')
+    except Exception as e:
+        print(f'Failed to send media group: {str(e)}')
+        return False, None
+
+def get_photo_file_id(message: Dict[str, Any]) -> Optional[str]:
+    photo_sizes = message.get('photo') or []
+    return photo_sizes[-1]['file_id'] if photo_sizes else None
+
+def save_card_file_id(conn, card: Dict[str, Any], file_id: str):
+    cur = conn.cursor()
+    cur.execute(
+        'UPDATE cards SET telegram_file_id = %s WHERE id = %s AND image_url = %s',
+        (file_id, card['id'], card['image_url'])
+    )
+    conn.commit()
+    cur.close()
+
+def stream_active_chat_ids(conn, batch_size: int) -> Iterator[array]:
+    cur = conn.cursor(name='active_subscribers')
+    cur.itersize = batch_size
+    cur.execute('SELECT chat_id FROM telegram_subscribers WHERE is_active = true ORDER BY chat_id')
+    
+    try:
+        batch = array('q')
+        for (chat_id,) in cur:
+            batch.append(chat_id)
+            if len(batch) == batch_size:
+                yield batch
+                batch = array('q')
+        if batch:
+            yield batch
+    finally:
+        cur.close()
+
+def send_card_photo(bot_token: str, conn, card: Dict[str, Any], caption: str, chat_id: int) -> bool:
+    if card['telegram_file_id']:
+        return send_telegram_photo(bot_token, chat_id, card['telegram_file_id'], caption)
+    
+    message = upload_telegram_photo(bot_token, chat_id, card['image_url'], caption)
+    if not message:
         return False
+    
+    file_id = get_photo_file_id(message)
+    if file_id:
+        save_card_file_id(conn, card, file_id)
+        card['telegram_file_id'] = file_id
+    return True
+
+def send_card_album(bot_token: str, conn, cards: List[Tuple[Dict[str, Any], str]], chat_id: int) -> bool:
+    if len(cards) == 1:
+        card, caption = cards[0]
+        return send_card_photo(bot_token, conn, card, caption, chat_id)
+    
+    media = [
+        {
+            'type': 'photo',
+            'media': card['telegram_file_id'] or card['image_url'],
+            'caption': caption,
+            'parse_mode': 'HTML'
+        }
+        for card, caption in cards
+    ]
+    needs_file_ids = any(not card['telegram_file_id'] for card, _ in cards)
+    
+    ok, messages = send_media_group(bot_token, chat_id, media, parse_result=needs_file_ids)
+    if not ok or not messages:
+        return ok
+    
+    for (card, _), message in zip(cards, messages):
+        if card['telegram_file_id']:
+            continue
+        file_id = get_photo_file_id(message)
+        if file_id:
+            save_card_file_id(conn, card, file_id)
+            card['telegram_file_id'] = file_id
+    return True
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    metrics.begin(event.get('httpMethod', 'POST').lower())
+    status = 500
+    try:
+        response = handle_request(event)
+        status = response['statusCode']
+        return response
+    finally:
+        metrics.finish(context, status)
+
+def handle_request(event: Dict[str, Any]) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
@@ -83,30 +434,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         date_str = f"{str(date.month).zfill(2)}-{str(date.day).zfill(2)}"
         dates_to_send.append(date_str)
     
-    cur.execute('SELECT chat_id FROM telegram_subscribers WHERE is_active = true')
-    subscribers = cur.fetchall()
-    
-    if not subscribers:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'message': 'Нет активных подписчиков',
-                'sent_count': 0
-            }),
-            'isBase64Encoded': False
-        }
+    cur.execute('SELECT * FROM cards WHERE date = ANY(%s)', (dates_to_send,))
+    cards_by_date = {card['date']: card for card in cur.fetchall()}
+    conn.commit()
     
-    total_sent = 0
-    total_failed = 0
+    cards = []
     cards_sent = []
     
     for date_str in dates_to_send:
-        cur.execute('SELECT * FROM cards WHERE date = %s', (date_str,))
-        card = cur.fetchone()
+        card = cards_by_date.get(date_str)
         
         if not card:
             continue
@@ -115,22 +451,45 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if card['is_holiday'] and card['holiday_name']:
             caption = f"🎉 <b>{card['holiday_name']}</b> 🎉\n\n{card['message']}"
         
-        for subscriber in subscribers:
-            chat_id = subscriber['chat_id']
-            
-            if send_telegram_photo(bot_token, chat_id, card['image_url'], caption):
-                total_sent += 1
-            else:
-                total_failed += 1
-        
+        cards.append((card, caption))
         cards_sent.append({
             'date': date_str,
             'title': card['title'],
             'is_holiday': card['is_holiday']
         })
     
+    albums = [cards[i:i + MEDIA_GROUP_SIZE] for i in range(0, len(cards), MEDIA_GROUP_SIZE)]
+    
+    total_sent = 0
+    total_failed = 0
+    subscribers_count = 0
+    
+    read_conn = get_db_connection()
+    for chat_ids in stream_active_chat_ids(read_conn, SUBSCRIBERS_BATCH_SIZE):
+        subscribers_count += len(chat_ids)
+        
+        for chat_id in chat_ids:
+            for album in albums:
+                if send_card_album(bot_token, conn, album, chat_id):
+                    total_sent += len(album)
+                else:
+                    total_failed += len(album)
+    release_db_connection(read_conn)
+    
     cur.close()
-    conn.close()
+    release_db_connection(conn)
+    
+    if not subscribers_count:
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'message': 'Нет активных подписчиков',
+                'sent_count': 0
+            }),
+            'isBase64Encoded': False
+        }
     
     return {
         'statusCode': 200,
@@ -139,9 +498,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'success': True,
             'sent_count': total_sent,
             'failed_count': total_failed,
-            'subscribers_count': len(subscribers),
+            'subscribers_count': subscribers_count,
             'cards_sent': cards_sent,
-            'message': f'Отправлено {total_sent} открыток ({len(cards_sent)} дней) для {len(subscribers)} подписчиков'
+            'message': f'Отправлено {total_sent} открыток ({len(cards_sent)} дней) для {subscribers_count} подписчиков'
         }),
         'isBase64Encoded': False
     }
\ No newline at end of file
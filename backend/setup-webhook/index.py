@@ -7,11 +7,82 @@ Returns: HTTP response dict
 
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from typing import Dict, Any
 import urllib.request
 import urllib.parse
 
+FUNCTION_NAME = 'setup-webhook'
+
+class RequestMetrics:
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.lock = threading.Lock()
+        self.action = ''
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {'db_round_trips': 0, 'api_calls': 0}
+    
+    def begin(self, action: str):
+        with self.lock:
+            self.action = action
+            self.phases = {}
+            self.counters = {'db_round_trips': 0, 'api_calls': 0}
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.totals[name] = self.totals.get(name, 0) + amount
+    
+    def finish(self, context: Any, status: int):
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            action, phases, counters = self.action, self.phases, self.counters
+        
+        print(json.dumps({
+            'metric': 'request',
+            'function': self.function_name,
+            'request_id': getattr(context, 'request_id', None),
+            'action': action,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'phases_ms': {name: round(elapsed * 1000, 2) for name, elapsed in phases.items()},
+            **counters
+        }, separators=(',', ':')))
+
+metrics = RequestMetrics(FUNCTION_NAME)
+
+def call_telegram(req: urllib.request.Request) -> Dict[str, Any]:
+    metrics.count('api_calls')
+    with metrics.phase('telegram_api'):
+        with urllib.request.urlopen(req) as response:
+            return json.loads(response.read().decode('utf-8'))
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    metrics.begin(event.get('httpMethod', 'POST').lower())
+    status = 500
+    try:
+        response = handle_request(event)
+        status = response['statusCode']
+        return response
+    finally:
+        metrics.finish(context, status)
+
+def handle_request(event: Dict[str, Any]) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
@@ -55,30 +126,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         try:
             data_encoded = urllib.parse.urlencode(params).encode('utf-8')
             req = urllib.request.Request(api_url, data=data_encoded)
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                
-                if result.get('ok'):
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'success': True,
-                            'message': 'Webhook успешно настроен!',
-                            'webhook_url': bot_function_url
-                        }),
-                        'isBase64Encoded': False
-                    }
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'error': 'Failed to set webhook',
-                            'details': result.get('description', 'Unknown error')
-                        }),
-                        'isBase64Encoded': False
-                    }
+            result = call_telegram(req)
+            
+            if result.get('ok'):
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'success': True,
+                        'message': 'Webhook успешно настроен!',
+                        'webhook_url': bot_function_url
+                    }),
+                    'isBase64Encoded': False
+                }
+            else:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'error': 'Failed to set webhook',
+                        'details': result.get('description', 'Unknown error')
+                    }),
+                    'isBase64Encoded': False
+                }
         except Exception as e:
             return {
                 'statusCode': 500,
@@ -92,24 +162,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         try:
             req = urllib.request.Request(api_url)
-            with urllib.request.urlopen(req) as response:
-                result = json.loads(response.read().decode('utf-8'))
-                
-                if result.get('ok'):
-                    webhook_info = result.get('result', {})
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
-                            'webhook_url': webhook_info.get('url', ''),
-                            'has_custom_certificate': webhook_info.get('has_custom_certificate', False),
-                            'pending_update_count': webhook_info.get('pending_update_count', 0),
-                            'last_error_date': webhook_info.get('last_error_date'),
-                            'last_error_message': webhook_info.get('last_error_message'),
-                            'max_connections': webhook_info.get('max_connections', 40)
-                        }),
-                        'isBase64Encoded': False
-                    }
+            result = call_telegram(req)
+            
+            if result.get('ok'):
+                webhook_info = result.get('result', {})
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'webhook_url': webhook_info.get('url', ''),
+                        'has_custom_certificate': webhook_info.get('has_custom_certificate', False),
+                        'pending_update_count': webhook_info.get('pending_update_count', 0),
+                        'last_error_date': webhook_info.get('last_error_date'),
+                        'last_error_message': webhook_info.get('last_error_message'),
+                        'max_connections': webhook_info.get('max_connections', 40)
+                    }),
+                    'isBase64Encoded': False
+                }
         except Exception as e:
             return {
                 'statusCode': 500,
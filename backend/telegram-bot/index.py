@@ -7,73 +7,851 @@ Returns: HTTP response dict
 
 import json
 import os
-from typing import Dict, Any, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import urllib.request
-import urllib.parse
+import random
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Iterable, Iterator, List, Tuple, NamedTuple
+
+BROADCAST_WORKERS = int(os.environ.get('BROADCAST_WORKERS', '16'))
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', '30'))
+BROADCAST_PER_CHAT_INTERVAL = float(os.environ.get('BROADCAST_PER_CHAT_INTERVAL', '1'))
+BROADCAST_MAX_ATTEMPTS = int(os.environ.get('BROADCAST_MAX_ATTEMPTS', '3'))
+DELIVERY_FLUSH_SIZE = int(os.environ.get('DELIVERY_FLUSH_SIZE', '500'))
+BROADCAST_PAGE_SIZE = int(os.environ.get('BROADCAST_PAGE_SIZE', '300'))
+BROADCAST_TIME_BUDGET = float(os.environ.get('BROADCAST_TIME_BUDGET', '240'))
+MIN_CHAT_ID = -2 ** 63
+BROADCAST_SHARDS = int(os.environ.get('BROADCAST_SHARDS', '4'))
+BROADCAST_MAX_SHARDS = int(os.environ.get('BROADCAST_MAX_SHARDS', '32'))
+SHARED_RATE_BATCH = int(os.environ.get('SHARED_RATE_BATCH', '5'))
+TELEGRAM_BOT_URL = os.environ.get('TELEGRAM_BOT_URL', '')
+DELIVERY_QUEUE_BATCH_SIZE = int(os.environ.get('DELIVERY_QUEUE_BATCH_SIZE', str(BROADCAST_PAGE_SIZE)))
+DELIVERY_QUEUE_LEASE = int(os.environ.get('DELIVERY_QUEUE_LEASE', '300'))
+DELIVERY_QUEUE_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_QUEUE_MAX_ATTEMPTS', '5'))
+DELIVERY_QUEUE_RETRY_BACKOFF = int(os.environ.get('DELIVERY_QUEUE_RETRY_BACKOFF', '60'))
+DELIVERY_QUEUE_RETENTION_DAYS = int(os.environ.get('DELIVERY_QUEUE_RETENTION_DAYS', '7'))
+DELIVERY_LOG_RETENTION_DAYS = int(os.environ.get('DELIVERY_LOG_RETENTION_DAYS', '30'))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+DB_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_HEALTH_CHECK_INTERVAL', '30'))
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+TELEGRAM_POOL_SIZE = int(os.environ.get('TELEGRAM_POOL_SIZE', str(BROADCAST_WORKERS)))
+TELEGRAM_TIMEOUT = float(os.environ.get('TELEGRAM_TIMEOUT', '10'))
+PROCESSED_UPDATES_CACHE_SIZE = int(os.environ.get('PROCESSED_UPDATES_CACHE_SIZE', '10000'))
+PROCESSED_UPDATES_TTL = int(os.environ.get('PROCESSED_UPDATES_TTL', '86400'))
+PROCESSED_UPDATES_CLEANUP_INTERVAL = float(os.environ.get('PROCESSED_UPDATES_CLEANUP_INTERVAL', '600'))
+SUBSCRIPTION_CACHE_SIZE = int(os.environ.get('SUBSCRIPTION_CACHE_SIZE', '10000'))
+SUBSCRIPTION_CACHE_TTL = float(os.environ.get('SUBSCRIPTION_CACHE_TTL', '300'))
+DELIVERY_LOCAL_HOUR = int(os.environ.get('DELIVERY_LOCAL_HOUR', '8'))
+DEFAULT_UTC_OFFSET_MINUTES = 180
+MIN_UTC_OFFSET_MINUTES = -720
+MAX_UTC_OFFSET_MINUTES = 840
+UTC_OFFSET_RE = re.compile(r'^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$', re.IGNORECASE)
+DAILY_RUN_KEY_RE = re.compile(r'^daily:(\d{4}-\d{2}-\d{2}):([+-]\d+)$')
+STATEFUL_COMMANDS = frozenset(('/subscribe', '/unsubscribe'))
+FUNCTION_NAME = 'telegram-bot'
+API_ACTIONS = frozenset((
+    'send_daily_cards', 'enqueue_daily_cards', 'process_delivery_queue', 'send_daily_cards_sharded', 'subscribe',
+    'reconcile_subscriber_stats'
+))
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+    
+    def render(self, name: str, labels: str) -> Iterator[str]:
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        cumulative += self.counts[-1]
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {cumulative}'
+
+class RequestMetrics:
+    def __init__(self, function_name: str, buckets: Tuple[float, ...] = METRICS_BUCKETS):
+        self.function_name = function_name
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.action = ''
+        self.started = 0.0
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {'db_round_trips': 0, 'api_calls': 0}
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.durations: Dict[str, Histogram] = {}
+        self.phase_durations: Dict[str, Histogram] = {}
+    
+    def begin(self, action: str):
+        with self.lock:
+            self.action = action
+            self.phases = {}
+            self.counters = {'db_round_trips': 0, 'api_calls': 0}
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.phases[name] = self.phases.get(name, 0) + elapsed
+    
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.totals[name] = self.totals.get(name, 0) + amount
+    
+    def finish(self, context: Any, status: int):
+        duration = time.perf_counter() - self.started
+        with self.lock:
+            action, phases, counters = self.action, self.phases, self.counters
+            self.requests[(action, status)] = self.requests.get((action, status), 0) + 1
+            self.durations.setdefault(action, Histogram(self.buckets)).observe(duration)
+            for name, elapsed in phases.items():
+                self.phase_durations.setdefault(name, Histogram(self.buckets)).observe(elapsed)
+        
+        print(json.dumps({
+            'metric': 'request',
+            'function': self.function_name,
+            'request_id': getattr(context, 'request_id', None),
+            'action': action,
+            'status': status,
+            'duration_ms': round(duration * 1000, 2),
+            'phases_ms': {name: round(elapsed * 1000, 2) for name, elapsed in phases.items()},
+            **counters
+        }, separators=(',', ':')))
+    
+    def render(self) -> str:
+        function = f'function="{self.function_name}"'
+        lines = [
+            '# HELP cards_requests_total Handled requests by action and HTTP status.',
+            '# TYPE cards_requests_total counter'
+        ]
+        with self.lock:
+            for (action, status), count in sorted(self.requests.items()):
+                lines.append(f'cards_requests_total{{{function},action="{action}",status="{status}"}} {count}')
+            
+            lines += [
+                '# HELP cards_request_duration_seconds Handler wall time by action.',
+                '# TYPE cards_request_duration_seconds histogram'
+            ]
+            for action, histogram in sorted(self.durations.items()):
+                lines.extend(histogram.render('cards_request_duration_seconds', f'{function},action="{action}"'))
+            
+            lines += [
+                '# HELP cards_phase_duration_seconds Time spent per phase within one request.',
+                '# TYPE cards_phase_duration_seconds histogram'
+            ]
+            for name, histogram in sorted(self.phase_durations.items()):
+                lines.extend(histogram.render('cards_phase_duration_seconds', f'{function},phase="{name}"'))
+            
+            for name, total in sorted(self.totals.items()):
+                lines += [
+                    f'# TYPE cards_{name}_total counter',
+                    f'cards_{name}_total{{{function}}} {total}'
+                ]
+        return '\n'.join(lines) + '\n'
+
+metrics = RequestMetrics(FUNCTION_NAME)
+
+class SendResult(NamedTuple):
+    ok: bool
+    error_code: int = 0
+    description: str = ''
+    retry_after: float = 0
+    result: Any = None
+    
+    @property
+    def chat_unavailable(self) -> bool:
+        if self.error_code == 403:
+            return True
+        return self.error_code == 400 and 'chat not found' in self.description.lower()
+    
+    @property
+    def retryable(self) -> bool:
+        return not self.ok and (self.error_code == 0 or self.error_code == 429 or self.error_code >= 500)
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.updated_at:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                    self.updated_at = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.updated_at - now
+            time.sleep(delay)
+    
+    def pause(self, seconds: float):
+        with self.lock:
+            self.tokens = 0
+            self.updated_at = max(self.updated_at, time.monotonic() + seconds)
+
+class ChatRateLimiter:
+    def __init__(self, interval: float, prune_threshold: int = 10000):
+        self.interval = interval
+        self.prune_threshold = prune_threshold
+        self.next_allowed: Dict[int, float] = {}
+        self.lock = threading.Lock()
+    
+    def acquire(self, chat_id: int):
+        with self.lock:
+            now = time.monotonic()
+            if len(self.next_allowed) > self.prune_threshold:
+                self.next_allowed = {k: v for k, v in self.next_allowed.items() if v > now}
+            slot = max(now, self.next_allowed.get(chat_id, now))
+            self.next_allowed[chat_id] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class SharedTokenBucket:
+    def __init__(self, name: str, rate: float, batch_size: int):
+        self.name = name
+        self.rate = rate
+        self.batch_size = batch_size
+        self.tokens = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                if self.tokens > 0:
+                    self.tokens -= 1
+                    return
+                granted, delay = self.take(self.batch_size)
+                if granted:
+                    self.tokens = granted - 1
+                    return
+            time.sleep(delay)
+    
+    def take(self, count: int) -> Tuple[int, float]:
+        need = min(count, max(1, int(self.rate)))
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        while True:
+            cur.execute('''
+                WITH bucket AS (
+                    SELECT name, clock_timestamp() AS now,
+                        LEAST(%s, tokens + EXTRACT(EPOCH FROM clock_timestamp() - refilled_at) * %s) AS available
+                    FROM rate_limit_buckets WHERE name = %s
+                    FOR UPDATE
+                )
+                UPDATE rate_limit_buckets b
+                SET tokens = bucket.available - CASE WHEN bucket.available >= %s THEN %s ELSE 0 END,
+                    refilled_at = bucket.now
+                FROM bucket
+                WHERE b.name = bucket.name
+                RETURNING bucket.available
+            ''', (self.rate, self.rate, self.name, need, need))
+            row = cur.fetchone()
+            if row is not None:
+                break
+            cur.execute(
+                'INSERT INTO rate_limit_buckets (name, tokens) VALUES (%s, %s) ON CONFLICT (name) DO NOTHING',
+                (self.name, self.rate)
+            )
+        
+        conn.commit()
+        cur.close()
+        release_db_connection(conn)
+        
+        available = float(row[0])
+        if available >= need:
+            return need, 0
+        return 0, (need - available) / self.rate + random.uniform(0, need / self.rate)
+    
+    def pause(self, seconds: float):
+        with self.lock:
+            self.tokens = 0
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute(
+            'UPDATE rate_limit_buckets SET tokens = %s, refilled_at = clock_timestamp() WHERE name = %s',
+            (-seconds * self.rate, self.name)
+        )
+        conn.commit()
+        cur.close()
+        release_db_connection(conn)
+
+global_rate_limiter = TokenBucket(BROADCAST_RATE)
+shared_rate_limiter = SharedTokenBucket('telegram', BROADCAST_RATE, SHARED_RATE_BATCH)
+chat_rate_limiter = ChatRateLimiter(BROADCAST_PER_CHAT_INTERVAL)
+
+class RecentUpdates:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.seen: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def add(self, update_id: int) -> bool:
+        with self.lock:
+            if update_id in self.seen:
+                self.seen.move_to_end(update_id)
+                return False
+            self.seen[update_id] = None
+            if len(self.seen) > self.max_size:
+                self.seen.popitem(last=False)
+            return True
+    
+    def discard(self, update_id: int):
+        with self.lock:
+            self.seen.pop(update_id, None)
+
+recent_updates = RecentUpdates(PROCESSED_UPDATES_CACHE_SIZE)
+processed_updates_cleaned_at = 0.0
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+    parent_run_id: Optional[int]
+
+class Subscription(NamedTuple):
+    is_active: bool
+    username: Optional[str]
+    first_name: Optional[str]
+    utc_offset_minutes: Optional[int]
+
+class SubscriptionCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, chat_id: int) -> Optional[Subscription]:
+        with self.lock:
+            entry = self.entries.get(chat_id)
+            if entry is None:
+                return None
+            subscription, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[chat_id]
+                return None
+            self.entries.move_to_end(chat_id)
+            return subscription
+    
+    def put(self, chat_id: int, subscription: Subscription):
+        with self.lock:
+            self.entries[chat_id] = (subscription, time.monotonic() + self.ttl)
+            self.entries.move_to_end(chat_id)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def discard(self, chat_id: int):
+        with self.lock:
+            self.entries.pop(chat_id, None)
+
+subscription_cache = SubscriptionCache(SUBSCRIPTION_CACHE_SIZE, SUBSCRIPTION_CACHE_TTL)
+
+def deliver_with_retry(chat_id: int, send: Callable[[int], SendResult],
+                       rate_limiter=global_rate_limiter) -> SendResult:
+    for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+        chat_rate_limiter.acquire(chat_id)
+        rate_limiter.acquire()
+        result = send(chat_id)
+        
+        if not result.retryable or attempt == BROADCAST_MAX_ATTEMPTS:
+            return result
+        
+        if result.retry_after:
+            print(f'Telegram rate limit hit, pausing for {result.retry_after}s')
+            rate_limiter.pause(result.retry_after)
+        else:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+    
+    return result
+
+def broadcast(chat_ids: Iterable[int], send: Callable[[int], SendResult],
+              rate_limiter=global_rate_limiter) -> Iterator[Tuple[int, SendResult]]:
+    def deliver(chat_id: int) -> Tuple[int, SendResult]:
+        return chat_id, deliver_with_retry(chat_id, send, rate_limiter)
+    
+    max_in_flight = BROADCAST_WORKERS * 2
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    
+    with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as executor:
+        pending = set()
+        for chat_id in chat_ids:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(deliver, chat_id))
+        
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+metered_connection_class = None
+
+def get_metered_connection_class():
+    global metered_connection_class
+    if metered_connection_class is not None:
+        return metered_connection_class
+    
+    import psycopg2.extensions
+    from psycopg2.extras import RealDictCursor
+    
+    class MeteredCursorMixin:
+        def execute(self, query, vars=None):
+            metrics.count('db_round_trips')
+            with metrics.phase('db'):
+                return super().execute(query, vars)
+        
+        def __iter__(self):
+            if not self.name:
+                return super().__iter__()
+            return self.iter_named()
+        
+        def iter_named(self):
+            while True:
+                metrics.count('db_round_trips')
+                with metrics.phase('db'):
+                    rows = self.fetchmany(self.itersize)
+                if not rows:
+                    return
+                yield from rows
+    
+    class MeteredCursor(MeteredCursorMixin, psycopg2.extensions.cursor):
+        pass
+    
+    class MeteredDictCursor(MeteredCursorMixin, RealDictCursor):
+        pass
+    
+    cursor_classes = {None: MeteredCursor, RealDictCursor: MeteredDictCursor}
+    
+    class MeteredConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            factory = kwargs.get('cursor_factory')
+            kwargs['cursor_factory'] = cursor_classes.get(factory, factory)
+            return super().cursor(*args, **kwargs)
+        
+        def commit(self):
+            metrics.count('db_round_trips')
+            with metrics.phase('db'):
+                return super().commit()
+        
+        def rollback(self):
+            metrics.count('db_round_trips')
+            with metrics.phase('db'):
+                return super().rollback()
+    
+    metered_connection_class = MeteredConnection
+    return metered_connection_class
+
+class ConnectionPool:
+    def __init__(self, dsn: str, max_idle: int, health_check_interval: float):
+        self.dsn = dsn
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def getconn(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released_at = self.idle.pop()
+            
+            if conn.closed:
+                continue
+            if time.monotonic() - released_at < self.health_check_interval or self.is_alive(conn):
+                return conn
+            conn.close()
+        
+        import psycopg2
+        with metrics.phase('db_connect'):
+            return psycopg2.connect(self.dsn, connection_factory=get_metered_connection_class())
+    
+    def putconn(self, conn):
+        import psycopg2.extensions
+        
+        if conn.closed:
+            return
+        
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return
+        
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+    
+    @staticmethod
+    def is_alive(conn) -> bool:
+        import psycopg2
+        
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+db_pool: Optional[ConnectionPool] = None
 
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    global db_pool
+    if db_pool is None:
+        db_pool = ConnectionPool(os.environ['DATABASE_URL'], DB_POOL_SIZE, DB_HEALTH_CHECK_INTERVAL)
+    return db_pool.getconn()
 
-def send_telegram_message(bot_token: str, chat_id: int, text: str, reply_markup: Optional[Dict] = None) -> bool:
-    api_url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
-    params = {
-        'chat_id': chat_id,
-        'text': text,
-        'parse_mode': 'HTML'
-    }
+def release_db_connection(conn):
+    if db_pool is None:
+        conn.close()
+        return
+    db_pool.putconn(conn)
+
+def dict_cursor(conn):
+    from psycopg2.extras import RealDictCursor
+    return conn.cursor(cursor_factory=RealDictCursor)
+
+class DeliveryBuffer:
+    def __init__(self, conn, card_id: int, flush_size: int = DELIVERY_FLUSH_SIZE):
+        self.conn = conn
+        self.card_id = card_id
+        self.flush_size = flush_size
+        self.chat_ids = []
+        self.statuses = []
+        self.error_codes = []
+        self.unavailable = []
     
-    if reply_markup:
-        params['reply_markup'] = json.dumps(reply_markup)
+    def add(self, chat_id: int, result: SendResult):
+        self.chat_ids.append(chat_id)
+        self.statuses.append(result.ok)
+        self.error_codes.append(result.error_code or None)
+        self.unavailable.append(result.chat_unavailable)
+        
+        if len(self.chat_ids) >= self.flush_size:
+            self.flush()
     
-    try:
-        data_encoded = urllib.parse.urlencode(params).encode('utf-8')
-        req = urllib.request.Request(api_url, data=data_encoded)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('ok', False)
-    except Exception as e:
-        print(f'Failed to send message: {str(e)}')
-        return False
+    def flush(self):
+        if not self.chat_ids:
+            return
+        
+        cur = self.conn.cursor()
+        cur.execute('''
+            WITH results AS (
+                SELECT * FROM unnest(%s::bigint[], %s::boolean[], %s::smallint[], %s::boolean[])
+                    AS r(chat_id, is_sent, error_code, is_unavailable)
+            ), logged AS (
+                INSERT INTO delivery_log (chat_id, card_id, is_sent, error_code)
+                SELECT chat_id, %s, is_sent, error_code FROM results
+            ), deactivated AS (
+                UPDATE telegram_subscribers s SET is_active = false
+                FROM results r
+                WHERE s.chat_id = r.chat_id AND r.is_unavailable
+            )
+            UPDATE telegram_subscribers s SET last_sent_at = CURRENT_TIMESTAMP
+            FROM results r
+            WHERE s.chat_id = r.chat_id AND r.is_sent
+        ''', (self.chat_ids, self.statuses, self.error_codes, self.unavailable, self.card_id))
+        cur.close()
+        
+        for chat_id, is_unavailable in zip(self.chat_ids, self.unavailable):
+            if is_unavailable:
+                subscription_cache.discard(chat_id)
+        
+        self.chat_ids = []
+        self.statuses = []
+        self.error_codes = []
+        self.unavailable = []
 
-def send_telegram_photo(bot_token: str, chat_id: int, photo_url: str, caption: str = '') -> bool:
-    api_url = f'https://api.telegram.org/bot{bot_token}/sendPhoto'
+class TelegramClient:
+    def __init__(self, base_url: str, pool_size: int, timeout: float):
+        scheme, _, location = base_url.partition('://')
+        self.host, _, path = location.partition('/')
+        self.secure = scheme == 'https'
+        self.path_prefix = f'/{path}'.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ssl_context = None
+        self.idle = []
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> Tuple['http.client.HTTPConnection', bool]:
+        import http.client
+        import ssl
+        
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+            if self.secure and self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+        if not self.secure:
+            return http.client.HTTPConnection(self.host, timeout=self.timeout), False
+        return http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self.ssl_context), False
+    
+    def release(self, conn: 'http.client.HTTPConnection'):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(conn)
+                return
+        conn.close()
+    
+    def request(self, bot_token: str, method: str, params: Dict[str, Any],
+                timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        import http.client
+        
+        body = json.dumps(params).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        
+        while True:
+            conn, reused = self.acquire()
+            conn.timeout = timeout or self.timeout
+            if conn.sock:
+                conn.sock.settimeout(conn.timeout)
+            
+            metrics.count('api_calls')
+            try:
+                with metrics.phase('telegram_api'):
+                    conn.request('POST', f'{self.path_prefix}/bot{bot_token}/{method}', body, headers)
+                    response = conn.getresponse()
+                    data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            
+            if response.will_close:
+                conn.close()
+            else:
+                self.release(conn)
+            return response.status, data
+    
+    def send(self, bot_token: str, method: str, params: Dict[str, Any],
+             timeout: Optional[float] = None, parse_result: bool = False) -> SendResult:
+        try:
+            status, data = self.request(bot_token, method, params, timeout)
+        except Exception as e:
+            return SendResult(False, description=str(e))
+        
+        if not parse_result and status == 200 and data[:16].replace(b' ', b'').startswith(b'{"ok":true'):
+            return SendResult(True)
+        
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return SendResult(False, status, data[:200].decode('utf-8', 'replace'))
+        
+        if payload.get('ok'):
+            return SendResult(True, result=payload.get('result'))
+        
+        parameters = payload.get('parameters') or {}
+        return SendResult(
+            False,
+            payload.get('error_code', status),
+            payload.get('description', ''),
+            parameters.get('retry_after', 0)
+        )
+
+telegram = TelegramClient(TELEGRAM_API_URL, TELEGRAM_POOL_SIZE, TELEGRAM_TIMEOUT)
+
+def send_telegram_photo(bot_token: str, chat_id: int, photo: str, caption: str = '',
+                        parse_result: bool = False) -> SendResult:
     params = {
         'chat_id': chat_id,
-        'photo': photo_url,
+        'photo': photo,
         'caption': caption,
         'parse_mode': 'HTML'
     }
     
-    try:
-        data_encoded = urllib.parse.urlencode(params).encode('utf-8')
-        req = urllib.request.Request(api_url, data=data_encoded)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('ok', False)
-    except Exception as e:
-        print(f'Failed to send photo: {str(e)}')
+    result = telegram.send(bot_token, 'sendPhoto', params, parse_result=parse_result)
+    if not result.ok:
+        print(f'Failed to send photo to {chat_id}: {result.error_code} {result.description}')
+    return result
+
+def get_photo_file_id(message: Dict[str, Any]) -> Optional[str]:
+    photo_sizes = message.get('photo') or []
+    return photo_sizes[-1]['file_id'] if photo_sizes else None
+
+def save_card_file_id(conn, card: Dict[str, Any], file_id: str):
+    cur = conn.cursor()
+    cur.execute(
+        'UPDATE cards SET telegram_file_id = %s WHERE id = %s AND image_url = %s',
+        (file_id, card['id'], card['image_url'])
+    )
+    cur.close()
+
+def claim_update(update_id: int, persist: bool = True) -> bool:
+    global processed_updates_cleaned_at
+    if not recent_updates.add(update_id):
         return False
+    if not persist:
+        return True
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            'INSERT INTO processed_updates (update_id) VALUES (%s) ON CONFLICT (update_id) DO NOTHING RETURNING update_id',
+            (update_id,)
+        )
+        claimed = cur.fetchone() is not None
+        
+        now = time.monotonic()
+        if now - processed_updates_cleaned_at >= PROCESSED_UPDATES_CLEANUP_INTERVAL:
+            processed_updates_cleaned_at = now
+            cur.execute(
+                "DELETE FROM processed_updates WHERE processed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'",
+                (PROCESSED_UPDATES_TTL,)
+            )
+        conn.commit()
+    except Exception:
+        recent_updates.discard(update_id)
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
+    return claimed
+
+def release_update(update_id: int, persist: bool = True):
+    recent_updates.discard(update_id)
+    if not persist:
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('DELETE FROM processed_updates WHERE update_id = %s', (update_id,))
+    conn.commit()
+    cur.close()
+    release_db_connection(conn)
+
+def handle_update(body_data: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
+    update_id = body_data.get('update_id')
+    persist = ('callback_query' in body_data
+               or body_data['message'].get('text', '').strip().partition(' ')[0] in STATEFUL_COMMANDS)
+    duplicate = update_id is not None and not claim_update(update_id, persist)
+    
+    try:
+        if 'message' in body_data:
+            return handle_message(body_data['message'], bot_token, duplicate)
+        return handle_callback_query(body_data['callback_query'], bot_token, duplicate)
+    except Exception:
+        if update_id is not None and not duplicate:
+            release_update(update_id, persist)
+        raise
+
+def reply_payload(text: str, reply_markup: Optional[str] = None) -> str:
+    payload = f', "text": {json.dumps(text, ensure_ascii=False)}, "parse_mode": "HTML"'
+    if reply_markup:
+        payload += f', "reply_markup": {reply_markup}'
+    return payload + '}'
+
+def webhook_reply(chat_id: int, payload: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': f'{{"method": "sendMessage", "chat_id": {int(chat_id)}{payload}',
+        'isBase64Encoded': False
+    }
+
+SUBSCRIBE_KEYBOARD = json.dumps({
+    'inline_keyboard': [[
+        {'text': '✨ Подписаться на открытки', 'callback_data': 'subscribe'}
+    ]]
+}, ensure_ascii=False)
+
+HELP_REPLY = reply_payload(
+    "📖 <b>Как пользоваться ботом:</b>\n\n"
+    "/start - Начать работу с ботом\n"
+    "/subscribe - Подписаться на рассылку\n"
+    "/subscribe +5 - Подписаться с вашим часовым поясом (UTC+5)\n"
+    "/unsubscribe - Отписаться от рассылки\n"
+    "/status - Проверить статус подписки\n"
+    "/help - Показать эту справку"
+)
+SUBSCRIBED_REPLY = reply_payload(
+    "✅ <b>Подписка активирована!</b>\n\n"
+    "Теперь вы будете получать красивые открытки каждый день! 💌\n\n"
+    "Чтобы отписаться, используйте команду /unsubscribe"
+)
+CALLBACK_SUBSCRIBED_REPLY = reply_payload(
+    "✅ <b>Отлично! Подписка активирована!</b>\n\n"
+    "🌸 Теперь вы будете получать красивые открытки каждый день!\n\n"
+    "💌 Первая открытка придет уже завтра утром\n\n"
+    "Чтобы отписаться в любой момент, используйте /unsubscribe"
+)
+UNSUBSCRIBED_REPLY = reply_payload(
+    "😢 <b>Подписка отменена</b>\n\n"
+    "Мы будем скучать! Если передумаете, напишите /subscribe"
+)
+STATUS_ACTIVE_REPLY = reply_payload("✅ <b>Ваша подписка активна!</b>\n\nВы получаете открытки каждый день 🎉")
+STATUS_INACTIVE_REPLY = reply_payload("❌ <b>Вы не подписаны</b>\n\nИспользуйте /subscribe для подписки")
+UNKNOWN_COMMAND_REPLY = reply_payload(
+    "Я не понимаю эту команду 😕\n\n"
+    "Используйте /help для списка доступных команд"
+)
 
 def answer_callback_query(bot_token: str, callback_query_id: str, text: str, show_alert: bool = False) -> bool:
-    api_url = f'https://api.telegram.org/bot{bot_token}/answerCallbackQuery'
     params = {
         'callback_query_id': callback_query_id,
         'text': text,
         'show_alert': show_alert
     }
     
-    try:
-        data_encoded = urllib.parse.urlencode(params).encode('utf-8')
-        req = urllib.request.Request(api_url, data=data_encoded)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            return result.get('ok', False)
-    except Exception:
-        return False
+    return telegram.send(bot_token, 'answerCallbackQuery', params).ok
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    metrics.begin(event.get('httpMethod', 'POST').lower())
+    status = 500
+    try:
+        response = handle_request(event)
+        status = response['statusCode']
+        return response
+    finally:
+        metrics.finish(context, status)
+
+def metrics_response() -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'text/plain; version=0.0.4'},
+        'body': metrics.render(),
+        'isBase64Encoded': False
+    }
+
+def handle_request(event: Dict[str, Any]) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
@@ -89,6 +867,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('action') == 'metrics':
+        metrics.action = 'metrics'
+        return metrics_response()
+    
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
     if not bot_token:
         return {
@@ -101,14 +883,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
         
-        if 'message' in body_data:
-            return handle_message(body_data['message'], bot_token)
-        elif 'callback_query' in body_data:
-            return handle_callback_query(body_data['callback_query'], bot_token)
+        if 'message' in body_data or 'callback_query' in body_data:
+            metrics.action = 'callback_query' if 'callback_query' in body_data else 'message'
+            return handle_update(body_data, bot_token)
         elif 'action' in body_data:
+            action = body_data['action']
+            metrics.action = action if isinstance(action, str) and action in API_ACTIONS else 'unknown'
             return handle_api_action(body_data, bot_token)
     
     if method == 'GET':
+        metrics.action = 'subscribers_count'
         return get_subscribers_count()
     
     return {
@@ -118,13 +902,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'isBase64Encoded': False
     }
 
-def handle_message(message: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
+def handle_message(message: Dict[str, Any], bot_token: str, duplicate: bool = False) -> Dict[str, Any]:
     chat_id = message['chat']['id']
-    text = message.get('text', '')
+    command, _, argument = message.get('text', '').strip().partition(' ')
     username = message['from'].get('username', '')
     first_name = message['from'].get('first_name', '')
     
-    if text == '/start':
+    if command == '/start':
         welcome_text = (
             f"🌸 Добро пожаловать, <b>{first_name}</b>!\n\n"
             "Я бот для ежедневной рассылки красивых открыток с пожеланиями.\n\n"
@@ -134,66 +918,29 @@ def handle_message(message: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
             "💝 Теплые слова и пожелания\n\n"
             "Нажмите кнопку ниже, чтобы подписаться!"
         )
-        
-        keyboard = {
-            'inline_keyboard': [[
-                {'text': '✨ Подписаться на открытки', 'callback_data': 'subscribe'}
-            ]]
-        }
-        
-        send_telegram_message(bot_token, chat_id, welcome_text, keyboard)
+        return webhook_reply(chat_id, reply_payload(welcome_text, SUBSCRIBE_KEYBOARD))
     
-    elif text == '/help':
-        help_text = (
-            "📖 <b>Как пользоваться ботом:</b>\n\n"
-            "/start - Начать работу с ботом\n"
-            "/subscribe - Подписаться на рассылку\n"
-            "/unsubscribe - Отписаться от рассылки\n"
-            "/status - Проверить статус подписки\n"
-            "/help - Показать эту справку"
-        )
-        send_telegram_message(bot_token, chat_id, help_text)
-    
-    elif text == '/subscribe':
-        subscribe_user_db(chat_id, username, first_name)
-        success_text = (
-            "✅ <b>Подписка активирована!</b>\n\n"
-            "Теперь вы будете получать красивые открытки каждый день! 💌\n\n"
-            "Чтобы отписаться, используйте команду /unsubscribe"
-        )
-        send_telegram_message(bot_token, chat_id, success_text)
+    elif command == '/help':
+        return webhook_reply(chat_id, HELP_REPLY)
     
-    elif text == '/unsubscribe':
-        unsubscribe_user_db(chat_id)
-        goodbye_text = (
-            "😢 <b>Подписка отменена</b>\n\n"
-            "Мы будем скучать! Если передумаете, напишите /subscribe"
-        )
-        send_telegram_message(bot_token, chat_id, goodbye_text)
+    elif command == '/subscribe':
+        if not duplicate:
+            subscribe_user_db(chat_id, username, first_name, parse_utc_offset(argument))
+        return webhook_reply(chat_id, SUBSCRIBED_REPLY)
     
-    elif text == '/status':
-        is_subscribed = check_subscription_status(chat_id)
-        if is_subscribed:
-            status_text = "✅ <b>Ваша подписка активна!</b>\n\nВы получаете открытки каждый день 🎉"
-        else:
-            status_text = "❌ <b>Вы не подписаны</b>\n\nИспользуйте /subscribe для подписки"
-        send_telegram_message(bot_token, chat_id, status_text)
+    elif command == '/unsubscribe':
+        if not duplicate:
+            unsubscribe_user_db(chat_id)
+        return webhook_reply(chat_id, UNSUBSCRIBED_REPLY)
     
-    else:
-        default_text = (
-            "Я не понимаю эту команду 😕\n\n"
-            "Используйте /help для списка доступных команд"
-        )
-        send_telegram_message(bot_token, chat_id, default_text)
+    elif command == '/status':
+        if check_subscription_status(chat_id):
+            return webhook_reply(chat_id, STATUS_ACTIVE_REPLY)
+        return webhook_reply(chat_id, STATUS_INACTIVE_REPLY)
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps({'ok': True}),
-        'isBase64Encoded': False
-    }
+    return webhook_reply(chat_id, UNKNOWN_COMMAND_REPLY)
 
-def handle_callback_query(callback_query: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
+def handle_callback_query(callback_query: Dict[str, Any], bot_token: str, duplicate: bool = False) -> Dict[str, Any]:
     callback_id = callback_query['id']
     chat_id = callback_query['message']['chat']['id']
     data = callback_query['data']
@@ -201,26 +948,16 @@ def handle_callback_query(callback_query: Dict[str, Any], bot_token: str) -> Dic
     first_name = callback_query['from'].get('first_name', '')
     
     if data == 'subscribe':
-        subscribe_user_db(chat_id, username, first_name)
-        answer_callback_query(bot_token, callback_id, '✅ Подписка оформлена!')
-        
-        success_text = (
-            "✅ <b>Отлично! Подписка активирована!</b>\n\n"
-            "🌸 Теперь вы будете получать красивые открытки каждый день!\n\n"
-            "💌 Первая открытка придет уже завтра утром\n\n"
-            "Чтобы отписаться в любой момент, используйте /unsubscribe"
-        )
-        send_telegram_message(bot_token, chat_id, success_text)
+        if not duplicate:
+            subscribe_user_db(chat_id, username, first_name)
+            answer_callback_query(bot_token, callback_id, '✅ Подписка оформлена!')
+        return webhook_reply(chat_id, CALLBACK_SUBSCRIBED_REPLY)
     
     elif data == 'unsubscribe':
-        unsubscribe_user_db(chat_id)
-        answer_callback_query(bot_token, callback_id, '😢 Подписка отменена')
-        
-        goodbye_text = (
-            "😢 <b>Подписка отменена</b>\n\n"
-            "Мы будем скучать! Если передумаете, напишите /subscribe"
-        )
-        send_telegram_message(bot_token, chat_id, goodbye_text)
+        if not duplicate:
+            unsubscribe_user_db(chat_id)
+            answer_callback_query(bot_token, callback_id, '😢 Подписка отменена')
+        return webhook_reply(chat_id, UNSUBSCRIBED_REPLY)
     
     return {
         'statusCode': 200,
@@ -229,43 +966,115 @@ def handle_callback_query(callback_query: Dict[str, Any], bot_token: str) -> Dic
         'isBase64Encoded': False
     }
 
-def subscribe_user_db(chat_id: int, username: str, first_name: str):
+def parse_utc_offset(value: Any) -> Optional[int]:
+    if isinstance(value, int) and not isinstance(value, bool):
+        minutes = value
+    else:
+        match = UTC_OFFSET_RE.match(str(value or '').strip())
+        if not match:
+            return None
+        sign, hours, mins = match.groups()
+        minutes = int(hours) * 60 + int(mins or 0)
+        if sign == '-':
+            minutes = -minutes
+    
+    if MIN_UTC_OFFSET_MINUTES <= minutes <= MAX_UTC_OFFSET_MINUTES:
+        return minutes
+    return None
+
+def subscribe_user_db(chat_id: int, username: Optional[str], first_name: Optional[str],
+                      utc_offset_minutes: Optional[int] = None):
     conn = get_db_connection()
     cur = conn.cursor()
     
     cur.execute('''
-        INSERT INTO telegram_subscribers (chat_id, username, first_name, is_active)
-        VALUES (%s, %s, %s, true)
+        INSERT INTO telegram_subscribers (chat_id, username, first_name, is_active, utc_offset_minutes)
+        VALUES (%s, %s, %s, true, COALESCE(%s, %s))
         ON CONFLICT (chat_id) 
-        DO UPDATE SET is_active = true, username = EXCLUDED.username, first_name = EXCLUDED.first_name
-    ''', (chat_id, username, first_name))
+        DO UPDATE SET is_active = true,
+            username = COALESCE(EXCLUDED.username, telegram_subscribers.username),
+            first_name = COALESCE(EXCLUDED.first_name, telegram_subscribers.first_name),
+            utc_offset_minutes = COALESCE(%s, telegram_subscribers.utc_offset_minutes)
+        WHERE (telegram_subscribers.is_active, telegram_subscribers.username, telegram_subscribers.first_name,
+                telegram_subscribers.utc_offset_minutes)
+            IS DISTINCT FROM (true, COALESCE(EXCLUDED.username, telegram_subscribers.username),
+                COALESCE(EXCLUDED.first_name, telegram_subscribers.first_name),
+                COALESCE(%s, telegram_subscribers.utc_offset_minutes))
+        RETURNING username, first_name, utc_offset_minutes
+    ''', (chat_id, username, first_name, utc_offset_minutes, DEFAULT_UTC_OFFSET_MINUTES, utc_offset_minutes,
+          utc_offset_minutes))
+    stored = cur.fetchone()
     
     conn.commit()
     cur.close()
-    conn.close()
+    release_db_connection(conn)
+    
+    if stored:
+        subscription_cache.put(chat_id, Subscription(True, *stored))
+    else:
+        subscription_cache.put(chat_id, Subscription(True, username, first_name, utc_offset_minutes))
 
 def unsubscribe_user_db(chat_id: int):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute('UPDATE telegram_subscribers SET is_active = false WHERE chat_id = %s', (chat_id,))
+    cur.execute('UPDATE telegram_subscribers SET is_active = false WHERE chat_id = %s AND is_active = true', (chat_id,))
     conn.commit()
     cur.close()
-    conn.close()
+    release_db_connection(conn)
+    
+    cached = subscription_cache.get(chat_id)
+    subscription = cached._replace(is_active=False) if cached else Subscription(False, None, None, None)
+    subscription_cache.put(chat_id, subscription)
 
 def check_subscription_status(chat_id: int) -> bool:
+    cached = subscription_cache.get(chat_id)
+    if cached:
+        return cached.is_active
+    
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT is_active FROM telegram_subscribers WHERE chat_id = %s', (chat_id,))
+    cur = dict_cursor(conn)
+    cur.execute('SELECT is_active, username, first_name, utc_offset_minutes FROM telegram_subscribers WHERE chat_id = %s', (chat_id,))
     result = cur.fetchone()
     cur.close()
-    conn.close()
-    return result and result['is_active']
+    release_db_connection(conn)
+    
+    if result:
+        subscription = Subscription(
+            result['is_active'], result['username'], result['first_name'], result['utc_offset_minutes']
+        )
+    else:
+        subscription = Subscription(False, None, None, None)
+    subscription_cache.put(chat_id, subscription)
+    return subscription.is_active
 
 def handle_api_action(data: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
     action = data.get('action')
     
     if action == 'send_daily_cards':
-        return send_daily_cards(bot_token)
+        shard, error = parse_shard(data)
+        if error:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': error}),
+                'isBase64Encoded': False
+            }
+        return send_daily_cards(bot_token, data.get('wave'), shard)
+    
+    if action == 'enqueue_daily_cards':
+        return enqueue_daily_cards(data.get('wave'))
+    
+    if action == 'process_delivery_queue':
+        return process_delivery_queue(bot_token)
+    
+    if action == 'send_daily_cards_sharded':
+        return send_daily_cards_sharded(data.get('wave'), data.get('shards', BROADCAST_SHARDS))
+    
+    if action == 'subscribe':
+        return subscribe_from_api(data)
+    
+    if action == 'reconcile_subscriber_stats':
+        return reconcile_subscriber_stats_from_api()
     
     return {
         'statusCode': 400,
@@ -274,77 +1083,779 @@ def handle_api_action(data: Dict[str, Any], bot_token: str) -> Dict[str, Any]:
         'isBase64Encoded': False
     }
 
-def send_daily_cards(bot_token: str) -> Dict[str, Any]:
-    from datetime import datetime
+def claim_broadcast_run(conn, segment_key: str, run_key: str, card_id: int,
+                        shard: Optional[Shard] = None) -> Tuple[Dict[str, Any], bool]:
+    cur = dict_cursor(conn)
+    cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (segment_key,))
+    if shard:
+        cur.execute('''
+            SELECT id, run_key, status, cursor_utc_offset, cursor_chat_id, sent_count, failed_count FROM broadcast_runs
+            WHERE run_key = %s OR (run_key LIKE %s AND run_key NOT LIKE %s)
+            LIMIT 1
+        ''', (segment_key, f'{segment_key}:%', f'{segment_key}:%/{shard.count}'))
+    else:
+        cur.execute('''
+            SELECT id, run_key, status, cursor_utc_offset, cursor_chat_id, sent_count, failed_count FROM broadcast_runs
+            WHERE run_key LIKE %s
+            LIMIT 1
+        ''', (f'{segment_key}:%',))
+    conflict = cur.fetchone()
+    if conflict:
+        conn.commit()
+        cur.close()
+        return conflict, False
     
-    today = datetime.now()
-    date_str = f"{str(today.month).zfill(2)}-{str(today.day).zfill(2)}"
+    cur.execute('''
+        INSERT INTO broadcast_runs (run_key, card_id, parent_id) VALUES (%s, %s, %s)
+        ON CONFLICT (run_key) DO NOTHING
+    ''', (run_key, card_id, shard.parent_run_id if shard else None))
+    cur.execute('''
+        UPDATE broadcast_runs
+        SET lease_until = CURRENT_TIMESTAMP + %s * INTERVAL '1 second', updated_at = CURRENT_TIMESTAMP
+        WHERE run_key = %s AND status = 'running'
+            AND (lease_until IS NULL OR lease_until < CURRENT_TIMESTAMP)
+        RETURNING id, run_key, status, cursor_utc_offset, cursor_chat_id, sent_count, failed_count
+    ''', (BROADCAST_TIME_BUDGET + 60, run_key))
+    run = cur.fetchone()
+    claimed = run is not None
     
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    if not claimed:
+        cur.execute(
+            'SELECT id, run_key, status, cursor_utc_offset, cursor_chat_id, sent_count, failed_count FROM broadcast_runs WHERE run_key = %s',
+            (run_key,)
+        )
+        run = cur.fetchone()
     
-    cur.execute('SELECT * FROM daily_cards WHERE date = %s', (date_str,))
+    conn.commit()
+    cur.close()
+    return run, claimed
+
+def checkpoint_broadcast_run(conn, run_id: int, cursor: Tuple[int, int], sent_count: int, failed_count: int):
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE broadcast_runs
+        SET cursor_utc_offset = %s,
+            cursor_chat_id = %s,
+            sent_count = sent_count + %s,
+            failed_count = failed_count + %s,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''', (cursor[0], cursor[1], sent_count, failed_count, run_id))
+    conn.commit()
+    cur.close()
+
+def release_broadcast_run(conn, run_id: int, has_more: bool) -> Dict[str, Any]:
+    cur = dict_cursor(conn)
+    cur.execute('''
+        UPDATE broadcast_runs
+        SET lease_until = NULL,
+            status = CASE WHEN %s THEN 'running' ELSE 'done' END,
+            finished_at = CASE WHEN %s THEN NULL ELSE CURRENT_TIMESTAMP END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        RETURNING sent_count, failed_count, parent_id
+    ''', (has_more, has_more, run_id))
+    totals = cur.fetchone()
+    
+    if totals['parent_id'] is not None:
+        refresh_parent_run(cur, totals['parent_id'])
+    
+    conn.commit()
+    cur.close()
+    return totals
+
+def refresh_parent_run(cur, parent_id: int):
+    cur.execute('''
+        UPDATE broadcast_runs p
+        SET sent_count = c.sent_count, failed_count = c.failed_count, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT COALESCE(SUM(sent_count), 0) AS sent_count, COALESCE(SUM(failed_count), 0) AS failed_count
+            FROM broadcast_runs WHERE parent_id = %s
+        ) c
+        WHERE p.id = %s
+    ''', (parent_id, parent_id))
+
+def stream_wave_chat_ids(conn, max_offset: int, after: Tuple[int, int], batch_size: int,
+                         shard: Optional[Shard] = None) -> Iterator[Tuple[array, Tuple[int, int]]]:
+    params = [after[0], after[1], max_offset]
+    shard_filter = ''
+    if shard:
+        shard_filter = 'AND abs(chat_id %% %s) = %s'
+        params += [shard.count, shard.index]
+    
+    cur = conn.cursor(name='wave_subscribers')
+    cur.itersize = batch_size
+    cur.execute(f'''
+        SELECT utc_offset_minutes, chat_id FROM telegram_subscribers
+        WHERE is_active = true AND (utc_offset_minutes, chat_id) > (%s, %s) AND utc_offset_minutes <= %s
+            {shard_filter}
+        ORDER BY utc_offset_minutes, chat_id
+    ''', params)
+    
+    try:
+        batch = array('q')
+        cursor = after
+        for utc_offset, chat_id in cur:
+            batch.append(chat_id)
+            cursor = (utc_offset, chat_id)
+            if len(batch) == batch_size:
+                yield batch, cursor
+                batch = array('q')
+        if batch:
+            yield batch, cursor
+    finally:
+        cur.close()
+
+def wave_segments(wave_start) -> List[Tuple[int, int, Any]]:
+    from datetime import timedelta
+    
+    base_offset = (DELIVERY_LOCAL_HOUR - wave_start.hour) * 60
+    segments = []
+    for min_offset in (base_offset - 1440, base_offset, base_offset + 1440):
+        max_offset = min(min_offset + 59, MAX_UTC_OFFSET_MINUTES)
+        min_offset = max(min_offset, MIN_UTC_OFFSET_MINUTES)
+        if min_offset <= max_offset:
+            segments.append((min_offset, max_offset, (wave_start + timedelta(minutes=min_offset)).date()))
+    return segments
+
+def unfinished_daily_segments(conn) -> List[Tuple[int, int, Any]]:
+    from datetime import date, datetime, timedelta, timezone
+    
+    cur = conn.cursor()
+    cur.execute("SELECT run_key FROM broadcast_runs WHERE status = 'running' AND run_key LIKE 'daily:%' ORDER BY id")
+    run_keys = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    
+    now = datetime.now(timezone.utc)
+    segments = []
+    for run_key in run_keys:
+        match = DAILY_RUN_KEY_RE.match(run_key)
+        if not match:
+            continue
+        local_date, min_offset = date.fromisoformat(match.group(1)), int(match.group(2))
+        if local_date == (now + timedelta(minutes=min_offset)).date():
+            segments.append((min_offset, min(min_offset + 59, MAX_UTC_OFFSET_MINUTES), local_date))
+    return segments
+
+def card_caption(card: Dict[str, Any]) -> str:
+    if card['is_holiday'] and card['holiday_name']:
+        return f"🎉 <b>{card['holiday_name']}</b> 🎉\n\n{card['message']}"
+    return f"<b>{card['title']}</b>\n\n{card['message']}"
+
+def send_card_to_chats(bot_token: str, conn, card: Dict[str, Any], caption: str, chat_ids: Iterable[int],
+                       deliveries: DeliveryBuffer, rate_limiter=global_rate_limiter,
+                       on_result: Optional[Callable[[int, SendResult], None]] = None) -> Tuple[int, int, int]:
+    sent_count = 0
+    failed_count = 0
+    unavailable_count = 0
+    chat_ids = iter(chat_ids)
+    
+    def record(chat_id: int, result: SendResult):
+        nonlocal sent_count, failed_count, unavailable_count
+        deliveries.add(chat_id, result)
+        if on_result:
+            on_result(chat_id, result)
+        if result.ok:
+            sent_count += 1
+        else:
+            failed_count += 1
+            unavailable_count += result.chat_unavailable
+    
+    if not card['telegram_file_id']:
+        def upload(chat_id: int) -> SendResult:
+            return send_telegram_photo(bot_token, chat_id, card['image_url'], caption, parse_result=True)
+        
+        for chat_id in chat_ids:
+            result = deliver_with_retry(chat_id, upload, rate_limiter)
+            record(chat_id, result)
+            if not result.ok:
+                continue
+            
+            file_id = get_photo_file_id(result.result)
+            if file_id:
+                save_card_file_id(conn, card, file_id)
+                card['telegram_file_id'] = file_id
+            break
+    
+    photo = card['telegram_file_id'] or card['image_url']
+    
+    def send(chat_id: int) -> SendResult:
+        return send_telegram_photo(bot_token, chat_id, photo, caption)
+    
+    for chat_id, result in broadcast(chat_ids, send, rate_limiter):
+        record(chat_id, result)
+    
+    return sent_count, failed_count, unavailable_count
+
+def prune_delivery_log(cur):
+    cur.execute(
+        "DELETE FROM delivery_log WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'",
+        (DELIVERY_LOG_RETENTION_DAYS,)
+    )
+
+def send_wave_segment(bot_token: str, conn, min_offset: int, max_offset: int, local_date,
+                      deadline: float, shard: Optional[Shard] = None) -> Dict[str, Any]:
+    cur = dict_cursor(conn)
+    cur.execute('SELECT * FROM cards WHERE date = %s', (f'{local_date:%m-%d}',))
     card = cur.fetchone()
+    conn.commit()
+    cur.close()
+    
+    segment = {
+        'local_date': f'{local_date:%Y-%m-%d}',
+        'utc_offsets': [min_offset, max_offset],
+        'has_more': False,
+        'sent_count': 0,
+        'failed_count': 0,
+        'deactivated_count': 0
+    }
     
     if not card:
+        segment['error'] = 'No card for date'
+        return segment
+    
+    segment['card_title'] = card['title']
+    segment_key = f'daily:{local_date:%Y-%m-%d}:{min_offset:+d}'
+    run_key = f'{segment_key}:{shard.index}/{shard.count}' if shard else segment_key
+    run, claimed = claim_broadcast_run(conn, segment_key, run_key, card['id'], shard)
+    segment['run_id'] = run['id']
+    
+    if run['run_key'] != run_key:
+        segment['error'] = f"Segment is already broadcast by run {run['run_key']}"
+        segment['status'] = run['status']
+        return segment
+    
+    if not claimed:
+        segment['status'] = run['status']
+        segment['has_more'] = run['status'] == 'running'
+        segment['total_sent'] = run['sent_count']
+        segment['total_failed'] = run['failed_count']
+        return segment
+    
+    deliveries = DeliveryBuffer(conn, card['id'])
+    caption = card_caption(card)
+    
+    if run['cursor_chat_id'] is not None:
+        cursor = (run['cursor_utc_offset'], run['cursor_chat_id'])
+    else:
+        cursor = (min_offset, MIN_CHAT_ID)
+    has_more = True
+    
+    read_conn = get_db_connection()
+    pages = stream_wave_chat_ids(read_conn, max_offset, cursor, BROADCAST_PAGE_SIZE, shard)
+    rate_limiter = shared_rate_limiter if shard else global_rate_limiter
+    
+    while time.monotonic() < deadline:
+        page = next(pages, None)
+        if page is None:
+            has_more = False
+            break
+        
+        chat_ids, cursor = page
+        page_sent, page_failed, page_deactivated = send_card_to_chats(
+            bot_token, conn, card, caption, chat_ids, deliveries, rate_limiter
+        )
+        segment['sent_count'] += page_sent
+        segment['failed_count'] += page_failed
+        segment['deactivated_count'] += page_deactivated
+        
+        deliveries.flush()
+        checkpoint_broadcast_run(conn, run['id'], cursor, page_sent, page_failed)
+    
+    pages.close()
+    release_db_connection(read_conn)
+    
+    totals = release_broadcast_run(conn, run['id'], has_more)
+    segment['status'] = 'running' if has_more else 'done'
+    segment['has_more'] = has_more
+    segment['total_sent'] = totals['sent_count']
+    segment['total_failed'] = totals['failed_count']
+    return segment
+
+def parse_wave(wave: Optional[str]):
+    from datetime import datetime, timezone
+    
+    if not wave:
+        return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    try:
+        return datetime.strptime(wave, '%Y-%m-%dT%H').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def parse_shard(data: Dict[str, Any]) -> Tuple[Optional[Shard], Optional[str]]:
+    if data.get('shard') is None and data.get('of') is None:
+        return None, None
+    
+    index, count, parent_run_id = data.get('shard'), data.get('of'), data.get('parent_run_id')
+    if not all(isinstance(value, int) for value in (index, count)) or not 0 <= index < count <= BROADCAST_MAX_SHARDS:
+        return None, f'shard/of must be integers with 0 <= shard < of <= {BROADCAST_MAX_SHARDS}'
+    if parent_run_id is not None and not isinstance(parent_run_id, int):
+        return None, 'parent_run_id must be an integer'
+    return Shard(index, count, parent_run_id), None
+
+def send_daily_cards(bot_token: str, wave: Optional[str] = None, shard: Optional[Shard] = None) -> Dict[str, Any]:
+    wave_start = parse_wave(wave)
+    if wave_start is None:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'wave must be YYYY-MM-DDTHH (UTC)'}),
+            'isBase64Encoded': False
+        }
+    
+    started_at = time.monotonic()
+    deadline = started_at + BROADCAST_TIME_BUDGET
+    segments = []
+    
+    conn = get_db_connection()
+    if not shard:
+        cur = conn.cursor()
+        prune_delivery_log(cur)
+        conn.commit()
         cur.close()
-        conn.close()
+    resumed = unfinished_daily_segments(conn) if not wave and not shard else []
+    pending = resumed + [segment for segment in wave_segments(wave_start) if segment not in resumed]
+    for min_offset, max_offset, local_date in pending:
+        segment = send_wave_segment(bot_token, conn, min_offset, max_offset, local_date, deadline, shard)
+        segment['resumed'] = (min_offset, max_offset, local_date) in resumed
+        segments.append(segment)
+    release_db_connection(conn)
+    
+    sent_count = sum(segment['sent_count'] for segment in segments)
+    duration = time.monotonic() - started_at
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'success': True,
+            'wave': f'{wave_start:%Y-%m-%dT%H}',
+            'shard': shard.index if shard else None,
+            'of': shard.count if shard else None,
+            'has_more': any(segment['has_more'] for segment in segments),
+            'sent_count': sent_count,
+            'failed_count': sum(segment['failed_count'] for segment in segments),
+            'deactivated_count': sum(segment['deactivated_count'] for segment in segments),
+            'segments': segments,
+            'duration_sec': round(duration, 3),
+            'messages_per_sec': round(sent_count / duration, 2) if duration > 0 else 0
+        }, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def invoke_shard(wave: str, shard: Shard, deadline: float) -> Dict[str, Any]:
+    import urllib.request
+    
+    body = json.dumps({
+        'action': 'send_daily_cards',
+        'wave': wave,
+        'shard': shard.index,
+        'of': shard.count,
+        'parent_run_id': shard.parent_run_id
+    }).encode('utf-8')
+    request = urllib.request.Request(
+        TELEGRAM_BOT_URL, data=body, headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    
+    metrics.count('api_calls')
+    try:
+        with metrics.phase('shard_invoke'):
+            with urllib.request.urlopen(request, timeout=max(1.0, deadline - time.monotonic())) as response:
+                return json.loads(response.read().decode('utf-8'))
+    except TimeoutError:
+        print(f'Shard {shard.index}/{shard.count} is still running after the coordinator budget')
+        return {'success': False, 'pending': True}
+    except Exception as e:
+        print(f'Shard {shard.index}/{shard.count} failed: {str(e)}')
+        return {'success': False, 'error': str(e)}
+
+def send_daily_cards_sharded(wave: Optional[str], shards: Any) -> Dict[str, Any]:
+    from concurrent.futures import ThreadPoolExecutor
+    
+    wave_start = parse_wave(wave)
+    if wave_start is None or not isinstance(shards, int) or not 1 <= shards <= BROADCAST_MAX_SHARDS:
         return {
-            'statusCode': 404,
+            'statusCode': 400,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'No card for today'}),
+            'body': json.dumps({
+                'error': f'wave must be YYYY-MM-DDTHH (UTC) and shards between 1 and {BROADCAST_MAX_SHARDS}'
+            }),
             'isBase64Encoded': False
         }
     
-    cur.execute('SELECT chat_id FROM telegram_subscribers WHERE is_active = true')
-    subscribers = cur.fetchall()
+    if not TELEGRAM_BOT_URL:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'TELEGRAM_BOT_URL not configured'}),
+            'isBase64Encoded': False
+        }
     
-    sent_count = 0
-    failed_count = 0
+    wave = f'{wave_start:%Y-%m-%dT%H}'
+    started_at = time.monotonic()
+    deadline = started_at + BROADCAST_TIME_BUDGET
     
-    caption = f"<b>{card['title']}</b>\n\n{card['message']}"
-    if card['is_holiday'] and card['holiday_name']:
-        caption = f"🎉 <b>{card['holiday_name']}</b> 🎉\n\n{card['message']}"
+    conn = get_db_connection()
+    cur = dict_cursor(conn)
+    cur.execute('''
+        INSERT INTO broadcast_runs (run_key, shard_count) VALUES (%s, %s)
+        ON CONFLICT (run_key) DO UPDATE SET status = 'running', finished_at = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE broadcast_runs.shard_count = EXCLUDED.shard_count
+        RETURNING id
+    ''', (f'wave:{wave}', shards))
+    parent = cur.fetchone()
+    if parent is None:
+        cur.execute('SELECT shard_count FROM broadcast_runs WHERE run_key = %s', (f'wave:{wave}',))
+        shard_count = cur.fetchone()['shard_count']
+        conn.commit()
+        cur.close()
+        release_db_connection(conn)
+        return {
+            'statusCode': 409,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': f'wave {wave} was started with shards={shard_count}', 'shards': shard_count}),
+            'isBase64Encoded': False
+        }
+    parent_id = parent['id']
+    conn.commit()
+    
+    with ThreadPoolExecutor(max_workers=shards) as executor:
+        results = list(executor.map(
+            lambda index: invoke_shard(wave, Shard(index, shards, parent_id), deadline), range(shards)
+        ))
+    
+    pending_shards = [index for index, result in enumerate(results) if result.get('pending')]
+    failed_shards = [index for index, result in enumerate(results)
+                     if not result.get('success') and not result.get('pending')]
+    has_more = bool(failed_shards or pending_shards) or any(result.get('has_more') for result in results)
+    
+    refresh_parent_run(cur, parent_id)
+    cur.execute('''
+        UPDATE broadcast_runs
+        SET status = CASE WHEN %s THEN 'running' ELSE 'done' END,
+            finished_at = CASE WHEN %s THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE id = %s
+        RETURNING sent_count, failed_count
+    ''', (has_more, has_more, parent_id))
+    totals = cur.fetchone()
+    conn.commit()
+    cur.close()
+    release_db_connection(conn)
+    
+    sent_count = sum(result.get('sent_count', 0) for result in results)
+    duration = time.monotonic() - started_at
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'success': not failed_shards,
+            'run_id': parent_id,
+            'wave': wave,
+            'shards': shards,
+            'failed_shards': failed_shards,
+            'pending_shards': pending_shards,
+            'has_more': has_more,
+            'sent_count': sent_count,
+            'failed_count': sum(result.get('failed_count', 0) for result in results),
+            'deactivated_count': sum(result.get('deactivated_count', 0) for result in results),
+            'total_sent': totals['sent_count'],
+            'total_failed': totals['failed_count'],
+            'duration_sec': round(duration, 3),
+            'messages_per_sec': round(sent_count / duration, 2) if duration > 0 else 0
+        }),
+        'isBase64Encoded': False
+    }
+
+def enqueue_daily_cards(wave: Optional[str]) -> Dict[str, Any]:
+    wave_start = parse_wave(wave)
+    if wave_start is None:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'wave must be YYYY-MM-DDTHH (UTC)'}),
+            'isBase64Encoded': False
+        }
     
-    for subscriber in subscribers:
-        chat_id = subscriber['chat_id']
+    conn = get_db_connection()
+    cur = dict_cursor(conn)
+    segments = []
+    
+    for min_offset, max_offset, local_date in wave_segments(wave_start):
+        cur.execute('SELECT id FROM cards WHERE date = %s', (f'{local_date:%m-%d}',))
+        card = cur.fetchone()
+        segment = {'local_date': f'{local_date:%Y-%m-%d}', 'utc_offsets': [min_offset, max_offset], 'enqueued': 0}
         
-        if send_telegram_photo(bot_token, chat_id, card['image_url'], caption):
-            sent_count += 1
-            cur.execute(
-                'UPDATE telegram_subscribers SET last_sent_at = CURRENT_TIMESTAMP WHERE chat_id = %s',
-                (chat_id,)
-            )
+        if card:
+            cur.execute('''
+                INSERT INTO delivery_queue (delivery_date, card_id, chat_id)
+                SELECT %s, %s, chat_id FROM telegram_subscribers
+                WHERE is_active = true AND utc_offset_minutes BETWEEN %s AND %s
+                ON CONFLICT (delivery_date, chat_id) DO NOTHING
+            ''', (local_date, card['id'], min_offset, max_offset))
+            segment['enqueued'] = cur.rowcount
         else:
-            failed_count += 1
+            segment['error'] = 'No card for date'
+        segments.append(segment)
     
+    cur.execute(
+        "DELETE FROM delivery_queue WHERE status IN ('done', 'failed') AND updated_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'",
+        (DELIVERY_QUEUE_RETENTION_DAYS,)
+    )
+    prune_delivery_log(cur)
     conn.commit()
     cur.close()
-    conn.close()
+    release_db_connection(conn)
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json'},
         'body': json.dumps({
             'success': True,
-            'sent_count': sent_count,
-            'failed_count': failed_count,
-            'card_title': card['title']
+            'wave': f'{wave_start:%Y-%m-%dT%H}',
+            'enqueued': sum(segment['enqueued'] for segment in segments),
+            'segments': segments
         }),
         'isBase64Encoded': False
     }
 
+def claim_delivery_batch(conn, batch_size: int) -> List[Dict[str, Any]]:
+    cur = dict_cursor(conn)
+    cur.execute('''
+        WITH due AS (
+            SELECT d.id, COALESCE(s.is_active, false) AS is_active
+            FROM delivery_queue d
+            LEFT JOIN telegram_subscribers s ON s.chat_id = d.chat_id
+            WHERE d.status IN ('pending', 'sending') AND d.next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY d.next_attempt_at
+            LIMIT %s
+            FOR UPDATE OF d SKIP LOCKED
+        )
+        UPDATE delivery_queue q
+        SET status = CASE WHEN NOT due.is_active OR q.attempts >= %s THEN 'failed' ELSE 'sending' END,
+            attempts = CASE WHEN due.is_active THEN LEAST(q.attempts + 1, %s) ELSE q.attempts END,
+            next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+            updated_at = CURRENT_TIMESTAMP
+        FROM due
+        WHERE q.id = due.id
+        RETURNING q.id, q.card_id, q.chat_id, q.attempts, q.status, due.is_active
+    ''', (batch_size, DELIVERY_QUEUE_MAX_ATTEMPTS, DELIVERY_QUEUE_MAX_ATTEMPTS, DELIVERY_QUEUE_LEASE))
+    batch = cur.fetchall()
+    conn.commit()
+    cur.close()
+    return batch
+
+def release_delivery_rows(conn, ids: List[int]):
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE delivery_queue
+        SET status = 'pending', attempts = attempts - 1, next_attempt_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ANY(%s) AND status = 'sending'
+    ''', (ids,))
+    cur.close()
+
+def complete_delivery_batch(conn, outcomes: List[Tuple[int, int, SendResult]]):
+    ids, statuses, error_codes, delays = [], [], [], []
+    for queue_id, attempts, result in outcomes:
+        ids.append(queue_id)
+        error_codes.append(None if result.ok else result.error_code)
+        if result.ok:
+            statuses.append('done')
+        elif result.retryable and attempts < DELIVERY_QUEUE_MAX_ATTEMPTS:
+            statuses.append('pending')
+        else:
+            statuses.append('failed')
+        delays.append(DELIVERY_QUEUE_RETRY_BACKOFF * 2 ** (attempts - 1))
+    
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE delivery_queue q
+        SET status = r.status,
+            error_code = r.error_code,
+            next_attempt_at = CURRENT_TIMESTAMP + r.delay * INTERVAL '1 second',
+            updated_at = CURRENT_TIMESTAMP
+        FROM unnest(%s::bigint[], %s::varchar[], %s::smallint[], %s::integer[]) AS r(id, status, error_code, delay)
+        WHERE q.id = r.id
+    ''', (ids, statuses, error_codes, delays))
+    cur.close()
+
+def process_delivery_queue(bot_token: str) -> Dict[str, Any]:
+    started_at = time.monotonic()
+    deadline = started_at + BROADCAST_TIME_BUDGET
+    stats = {'claimed': 0, 'sent_count': 0, 'failed_count': 0, 'retry_count': 0, 'deactivated_count': 0,
+             'unsubscribed_count': 0}
+    cards: Dict[int, Dict[str, Any]] = {}
+    has_more = True
+    
+    batch_size = DELIVERY_QUEUE_BATCH_SIZE
+    lease_margin = min(DELIVERY_QUEUE_LEASE / 2, BROADCAST_MAX_ATTEMPTS * TELEGRAM_TIMEOUT)
+    
+    conn = get_db_connection()
+    cur = dict_cursor(conn)
+    
+    while time.monotonic() < deadline:
+        claimed_at = time.monotonic()
+        batch_deadline = min(deadline, claimed_at + DELIVERY_QUEUE_LEASE - lease_margin)
+        claimed = claim_delivery_batch(conn, batch_size)
+        if not claimed:
+            has_more = False
+            break
+        stats['claimed'] += len(claimed)
+        batch = [row for row in claimed if row['status'] == 'sending']
+        unsubscribed = sum(1 for row in claimed if not row['is_active'])
+        stats['unsubscribed_count'] += unsubscribed
+        stats['failed_count'] += len(claimed) - len(batch) - unsubscribed
+        
+        missing = list({row['card_id'] for row in batch} - cards.keys())
+        if missing:
+            cur.execute('SELECT * FROM cards WHERE id = ANY(%s)', (missing,))
+            cards.update((card['id'], card) for card in cur.fetchall())
+            conn.commit()
+        
+        by_card: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        for row in batch:
+            by_card.setdefault(row['card_id'], {})[row['chat_id']] = row
+        
+        def until_deadline(chat_ids: Iterable[int]) -> Iterator[int]:
+            for chat_id in chat_ids:
+                if time.monotonic() >= batch_deadline:
+                    return
+                yield chat_id
+        
+        outcomes = []
+        for card_id, rows in by_card.items():
+            card = cards.get(card_id)
+            if card is None:
+                outcomes.extend((row['id'], DELIVERY_QUEUE_MAX_ATTEMPTS, SendResult(False, 404, 'card not found'))
+                                for row in rows.values())
+                continue
+            
+            def on_result(chat_id: int, result: SendResult, rows=rows):
+                row = rows[chat_id]
+                outcomes.append((row['id'], row['attempts'], result))
+            
+            deliveries = DeliveryBuffer(conn, card_id)
+            sent, failed, deactivated = send_card_to_chats(
+                bot_token, conn, card, card_caption(card), until_deadline(rows.keys()), deliveries,
+                shared_rate_limiter, on_result
+            )
+            deliveries.flush()
+            stats['sent_count'] += sent
+            stats['failed_count'] += failed
+            stats['deactivated_count'] += deactivated
+        
+        stats['retry_count'] += sum(
+            1 for _, attempts, result in outcomes
+            if not result.ok and result.retryable and attempts < DELIVERY_QUEUE_MAX_ATTEMPTS
+        )
+        if outcomes:
+            complete_delivery_batch(conn, outcomes)
+        completed = {queue_id for queue_id, _, _ in outcomes}
+        unsent = [row['id'] for row in batch if row['id'] not in completed]
+        if unsent:
+            release_delivery_rows(conn, unsent)
+        conn.commit()
+        
+        elapsed = time.monotonic() - claimed_at
+        if outcomes and elapsed > 0:
+            fits_lease = int(len(outcomes) / elapsed * (DELIVERY_QUEUE_LEASE - lease_margin) / 2)
+            batch_size = max(1, min(DELIVERY_QUEUE_BATCH_SIZE, fits_lease))
+    
+    cur.close()
+    release_db_connection(conn)
+    duration = time.monotonic() - started_at
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'success': True,
+            'has_more': has_more,
+            **stats,
+            'duration_sec': round(duration, 3),
+            'messages_per_sec': round(stats['sent_count'] / duration, 2) if duration > 0 else 0
+        }),
+        'isBase64Encoded': False
+    }
+
+def subscribe_from_api(data: Dict[str, Any]) -> Dict[str, Any]:
+    chat_id = data.get('chat_id')
+    if not isinstance(chat_id, int) or isinstance(chat_id, bool):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'chat_id must be an integer'}),
+            'isBase64Encoded': False
+        }
+    
+    utc_offset_minutes = None
+    if data.get('utc_offset_minutes') is not None:
+        utc_offset_minutes = parse_utc_offset(data['utc_offset_minutes'])
+        if utc_offset_minutes is None:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'utc_offset_minutes must be between -720 and 840'}),
+                'isBase64Encoded': False
+            }
+    
+    subscribe_user_db(chat_id, data.get('username'), data.get('first_name'), utc_offset_minutes)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'success': True, 'message': 'Subscribed'}),
+        'isBase64Encoded': False
+    }
+
+def reconcile_subscriber_stats(conn) -> Dict[str, int]:
+    cur = dict_cursor(conn)
+    cur.execute('INSERT INTO subscriber_stats (id) VALUES (1) ON CONFLICT (id) DO NOTHING')
+    cur.execute('SELECT active_count FROM subscriber_stats WHERE id = 1 FOR UPDATE')
+    previous = cur.fetchone()['active_count']
+    
+    cur.execute('''
+        UPDATE subscriber_stats
+        SET active_count = (SELECT COUNT(*) FROM telegram_subscribers WHERE is_active = true),
+            reconciled_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+        RETURNING active_count
+    ''')
+    active_count = cur.fetchone()['active_count']
+    conn.commit()
+    cur.close()
+    
+    if active_count != previous:
+        print(f'Subscriber counter drift fixed: {previous} -> {active_count}')
+    return {'active_count': active_count, 'drift': active_count - previous}
+
+def reconcile_subscriber_stats_from_api() -> Dict[str, Any]:
+    conn = get_db_connection()
+    result = reconcile_subscriber_stats(conn)
+    release_db_connection(conn)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'success': True, **result}),
+        'isBase64Encoded': False
+    }
+
 def get_subscribers_count() -> Dict[str, Any]:
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT COUNT(*) as count FROM telegram_subscribers WHERE is_active = true')
-    result = cur.fetchone()
+    cur = conn.cursor()
+    cur.execute('SELECT active_count FROM subscriber_stats WHERE id = 1')
+    row = cur.fetchone()
     cur.close()
-    conn.close()
+    count = row[0] if row else reconcile_subscriber_stats(conn)['active_count']
+    release_db_connection(conn)
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps({'count': result['count']}),
+        'body': json.dumps({'count': count}),
         'isBase64Encoded': False
     }
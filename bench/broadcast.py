@@ -0,0 +1,221 @@
+'''
+Business: Нагрузочный замер рассылки (send_daily_cards, очередь доставки, send-test-cards) против локальной заглушки Bot API
+Args: --subscribers - размеры базы (по умолчанию 10000 100000); --scenarios - daily, queue, test-cards;
+      --test-cards-max - выше этого размера последовательный test-cards пропускается;
+      --latency-ms, --rate-429, --rate-403 - поведение заглушки; --rate - BROADCAST_RATE; --migrate - применить db_migrations
+Returns: JSON-строка на сценарий: messages_per_sec, p50/p99 задержки отправки, обращения к БД, пиковый RSS
+Usage: DATABASE_URL=postgresql://localhost/cards_bench python bench/broadcast.py --migrate --subscribers 10000 100000
+'''
+
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_bot_api import MockConfig, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = {
+    'daily': 'telegram-bot',
+    'queue': 'telegram-bot',
+    'test-cards': 'send-test-cards'
+}
+
+def apply_migrations(conn):
+    cur = conn.cursor()
+    for path in sorted(glob.glob(os.path.join(ROOT, 'db_migrations', 'V*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            cur.execute(f.read())
+    conn.commit()
+    cur.close()
+
+def seed_subscribers(conn, count: int):
+    cur = conn.cursor()
+    cur.execute('TRUNCATE telegram_subscribers RESTART IDENTITY')
+    cur.execute('''
+        INSERT INTO telegram_subscribers (chat_id, username, first_name, is_active)
+        SELECT g, 'user' || g, 'User', true FROM generate_series(1, %s) g
+    ''', (count,))
+    conn.commit()
+    cur.execute('ANALYZE telegram_subscribers')
+    conn.commit()
+    cur.close()
+
+def reset_state(conn, card_dates: List[str]):
+    cur = conn.cursor()
+    cur.execute('TRUNCATE delivery_log, delivery_queue, broadcast_runs, processed_updates, rate_limit_buckets')
+    cur.execute('UPDATE telegram_subscribers SET is_active = true, last_sent_at = NULL WHERE NOT is_active OR last_sent_at IS NOT NULL')
+    for card_date in card_dates:
+        cur.execute('''
+            INSERT INTO cards (date, title, message, image_url)
+            VALUES (%s, 'Bench', 'Bench card', 'https://example.com/bench.jpg')
+            ON CONFLICT (date) DO UPDATE SET telegram_file_id = NULL
+        ''', (card_date,))
+    conn.commit()
+    cur.close()
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def invoke(index, body: Dict[str, Any]) -> Dict[str, Any]:
+    response = index.handler({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"{body.get('action', 'request')} failed: {response['statusCode']} {response['body']}")
+    return json.loads(response['body'])
+
+def run_daily(index, wave: str, workers: int) -> int:
+    sent = 0
+    while True:
+        result = invoke(index, {'action': 'send_daily_cards', 'wave': wave})
+        sent += result['sent_count']
+        if not result['has_more']:
+            return sent
+
+def run_queue(index, wave: str, workers: int) -> int:
+    from concurrent.futures import ThreadPoolExecutor
+    
+    invoke(index, {'action': 'enqueue_daily_cards', 'wave': wave})
+    
+    def worker(_) -> int:
+        sent = 0
+        while True:
+            result = invoke(index, {'action': 'process_delivery_queue'})
+            sent += result['sent_count']
+            if not result['has_more']:
+                return sent
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(worker, range(workers)))
+
+def run_test_cards(index, wave: str, workers: int) -> int:
+    return invoke(index, {'days': 1})['sent_count']
+
+RUNNERS = {
+    'daily': run_daily,
+    'queue': run_queue,
+    'test-cards': run_test_cards
+}
+
+def run_child(scenario: str, wave: str, workers: int):
+    sys.path.insert(0, os.path.join(ROOT, 'backend', SCENARIOS[scenario]))
+    import index
+    
+    latencies: List[float] = []
+    request = index.telegram.request
+    
+    def timed_request(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    
+    index.telegram.request = timed_request
+    
+    started_at = time.perf_counter()
+    sent = RUNNERS[scenario](index, wave, workers)
+    duration = time.perf_counter() - started_at
+    
+    print(json.dumps({
+        'sent': sent,
+        'duration_sec': round(duration, 3),
+        'messages_per_sec': round(sent / duration, 1) if duration > 0 else 0,
+        'api_requests': len(latencies),
+        'send_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'send_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'db_round_trips': index.metrics.totals['db_round_trips'],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='Broadcast throughput benchmark against a mock Bot API')
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['daily', 'queue', 'test-cards'])
+    parser.add_argument('--latency-ms', type=float, default=30)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--rate-429', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--rate-403', type=float, default=0.01)
+    parser.add_argument('--rate', type=float, default=1000000, help='BROADCAST_RATE for the handlers')
+    parser.add_argument('--workers', type=int, default=4, help='parallel queue workers')
+    parser.add_argument('--test-cards-max', type=int, default=10000,
+                        help='skip the sequential test-cards scenario above this many subscribers')
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before seeding')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--wave', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        run_child(args.child, args.wave, args.workers)
+        return
+    
+    dsn = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(dsn)
+    if args.migrate:
+        apply_migrations(conn)
+    
+    # Подписчики по умолчанию живут в UTC+3, поэтому их утренняя волна начинается в 05:00 UTC
+    today = datetime.now(timezone.utc)
+    wave = f'{today:%Y-%m-%d}T05'
+    card_dates = sorted({f'{today:%m-%d}', f'{datetime.now():%m-%d}'})
+    
+    for count in args.subscribers:
+        seed_subscribers(conn, count)
+        
+        for scenario in args.scenarios:
+            if scenario == 'test-cards' and count > args.test_cards_max:
+                print(json.dumps({
+                    'scenario': scenario,
+                    'subscribers': count,
+                    'skipped': f'above --test-cards-max {args.test_cards_max}'
+                }))
+                continue
+            
+            reset_state(conn, card_dates)
+            
+            config = MockConfig(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.rate_403)
+            server = start_server(config)
+            env = dict(
+                os.environ,
+                TELEGRAM_API_URL=f'http://127.0.0.1:{server.server_port}',
+                TELEGRAM_BOT_TOKEN='bench',
+                BROADCAST_RATE=str(args.rate),
+                BROADCAST_PER_CHAT_INTERVAL='0',
+                BROADCAST_TIME_BUDGET='3600'
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', scenario, '--wave', wave,
+                 '--workers', str(args.workers)],
+                env=env, capture_output=True, text=True
+            )
+            server.shutdown()
+            
+            if output.returncode != 0:
+                print(json.dumps({'scenario': scenario, 'subscribers': count, 'error': output.stderr.strip()[-500:]}))
+                continue
+            
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(json.dumps({
+                'scenario': scenario,
+                'subscribers': count,
+                **result,
+                'mock': {key: config.stats[key] for key in ('connections', 'ok', 'rate_limited', 'blocked')}
+            }))
+    
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Business: Замер холодного старта облачных функций: импорт модуля и первый ответ handler
+Args: --runs - число запусков каждого сценария в отдельном интерпретаторе
+Returns: JSON-строка на сценарий с медианой/максимумом import_ms, first_response_ms и загруженными тяжелыми модулями
+Usage: python bench/cold_start.py --runs 20
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('psycopg2', 'http.client', 'ssl', 'concurrent.futures')
+
+def telegram_update(text: str) -> dict:
+    return {
+        'httpMethod': 'POST',
+        'body': json.dumps({
+            'update_id': 1,
+            'message': {'chat': {'id': 1}, 'from': {'first_name': 'Bench'}, 'text': text}
+        })
+    }
+
+SCENARIOS = [
+    ('telegram-bot', 'options', {'httpMethod': 'OPTIONS'}, False),
+    ('telegram-bot', '/help', telegram_update('/help'), False),
+    ('telegram-bot', 'unknown command', telegram_update('hello'), False),
+    ('telegram-bot', '/start', telegram_update('/start'), False),
+    ('telegram-bot', '/status', telegram_update('/status'), True),
+]
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import index
+imported = time.perf_counter()
+index.handler(json.loads(sys.argv[2]), None)
+responded = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (responded - started) * 1000,
+    'loaded': [name for name in json.loads(sys.argv[3]) if name in sys.modules]
+}))
+'''
+
+def run_probe(function: str, event: dict) -> dict:
+    env = dict(os.environ)
+    env.setdefault('TELEGRAM_BOT_TOKEN', 'bench')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, os.path.join(ROOT, 'backend', function), json.dumps(event), json.dumps(HEAVY_MODULES)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import-to-first-response time per handler')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    
+    for function, name, event, needs_db in SCENARIOS:
+        if needs_db and not os.environ.get('DATABASE_URL'):
+            print(json.dumps({'function': function, 'scenario': name, 'skipped': 'DATABASE_URL not set'}))
+            continue
+        
+        samples = [run_probe(function, event) for _ in range(args.runs)]
+        imports = [sample['import_ms'] for sample in samples]
+        responses = [sample['first_response_ms'] for sample in samples]
+        print(json.dumps({
+            'function': function,
+            'scenario': name,
+            'runs': args.runs,
+            'import_ms_median': round(statistics.median(imports), 2),
+            'first_response_ms_median': round(statistics.median(responses), 2),
+            'first_response_ms_max': round(max(responses), 2),
+            'loaded': samples[-1]['loaded']
+        }, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+'''
+Business: Локальная заглушка Telegram Bot API для нагрузочных замеров рассылки
+Args: --latency-ms, --jitter-ms - задержка ответа; --rate-429, --retry-after - доля ответов 429; --rate-403 - доля заблокировавших бота
+Returns: HTTP-сервер с keep-alive, принимающий sendPhoto/sendMessage/sendMediaGroup; GET /stats - счетчики
+Usage: python bench/mock_bot_api.py --port 8081 --latency-ms 40 --rate-429 0.001 --rate-403 0.02
+'''
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+
+METHODS = ('sendPhoto', 'sendMessage', 'sendMediaGroup', 'answerCallbackQuery')
+
+class MockConfig:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, rate_429: float = 0,
+                 retry_after: int = 1, rate_403: float = 0, seed: int = 1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rate_403 = rate_403
+        self.random = random.Random(seed)
+        self.blocked: Dict[int, bool] = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'connections': 0, 'ok': 0, 'rate_limited': 0, 'blocked': 0, 'methods': {}}
+    
+    def is_blocked(self, chat_id: int) -> bool:
+        with self.lock:
+            if chat_id not in self.blocked:
+                self.blocked[chat_id] = self.random.random() < self.rate_403
+            return self.blocked[chat_id]
+    
+    def roll_429(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.rate_429
+    
+    def count(self, method: str, outcome: str):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats[outcome] += 1
+            self.stats['methods'][method] = self.stats['methods'].get(method, 0) + 1
+
+def make_handler(config: MockConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+        
+        def setup(self):
+            with config.lock:
+                config.stats['connections'] += 1
+            super().setup()
+        
+        def log_message(self, *args):
+            pass
+        
+        def reply(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/stats'):
+                with config.lock:
+                    stats = dict(config.stats, methods=dict(config.stats['methods']))
+                self.reply(200, stats)
+                return
+            self.reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+        
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+            method = self.path.rsplit('/', 1)[-1]
+            
+            delay = config.latency_ms + config.random.uniform(0, config.jitter_ms) if config.jitter_ms else config.latency_ms
+            if delay:
+                time.sleep(delay / 1000)
+            
+            if method not in METHODS:
+                config.count(method, 'ok')
+                self.reply(200, {'ok': True, 'result': True})
+                return
+            
+            if config.roll_429():
+                config.count(method, 'rate_limited')
+                self.reply(429, {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {config.retry_after}',
+                    'parameters': {'retry_after': config.retry_after}
+                })
+                return
+            
+            chat_id = params.get('chat_id')
+            if isinstance(chat_id, int) and config.is_blocked(chat_id):
+                config.count(method, 'blocked')
+                self.reply(403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'})
+                return
+            
+            config.count(method, 'ok')
+            photo = {'file_id': f'mock-{method}', 'file_unique_id': 'mock', 'width': 1280, 'height': 1280}
+            if method == 'sendMediaGroup':
+                result = [
+                    {'message_id': index + 1, 'photo': [dict(photo, file_id=f'mock-{index}')]}
+                    for index, _ in enumerate(params.get('media', []))
+                ]
+            elif method == 'sendPhoto':
+                result = {'message_id': 1, 'photo': [photo]}
+            else:
+                result = {'message_id': 1} if method == 'sendMessage' else True
+            self.reply(200, {'ok': True, 'result': result})
+    
+    return Handler
+
+def start_server(config: MockConfig, port: int = 0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Telegram Bot API stand-in')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-429', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--rate-403', type=float, default=0)
+    args = parser.parse_args()
+    
+    server = start_server(
+        MockConfig(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.rate_403), args.port
+    )
+    print(f'Mock Bot API on http://127.0.0.1:{server.server_port}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
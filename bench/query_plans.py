@@ -0,0 +1,117 @@
+'''
+Business: Проверка планов запросов горячего пути подписчиков через EXPLAIN (частичные индексы вместо полного скана)
+Args: --subscribers - размер базы; --inactive-ratio - доля отписавшихся; --migrate - применить db_migrations
+Returns: JSON-строка на запрос (узел плана, индекс, ok); код выхода 1, если хотя бы один запрос ушел мимо индекса
+Usage: DATABASE_URL=postgresql://localhost/cards_bench python bench/query_plans.py --migrate --subscribers 100000
+'''
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Any, Iterator
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from broadcast import apply_migrations
+
+MIN_CHAT_ID = -2 ** 63
+
+# Запросы повторяют telegram-bot (волна и счетчик), send-test-cards (поток) и cards-api (открытка по дате)
+QUERIES = {
+    'wave_keyset': (
+        '''
+        SELECT utc_offset_minutes, chat_id FROM telegram_subscribers
+        WHERE is_active = true AND (utc_offset_minutes, chat_id) > (%s, %s) AND utc_offset_minutes <= %s
+        ORDER BY utc_offset_minutes, chat_id
+        ''',
+        (-720, MIN_CHAT_ID, 240),
+        'idx_subscribers_active_offset'
+    ),
+    'active_chat_ids': (
+        'SELECT chat_id FROM telegram_subscribers WHERE is_active = true ORDER BY chat_id',
+        (),
+        'idx_subscribers_active_chat_id'
+    ),
+    'subscribers_count': (
+        'SELECT COUNT(*) as count FROM telegram_subscribers WHERE is_active = true',
+        (),
+        'idx_subscribers_active_chat_id'
+    ),
+    'card_by_date': (
+        'SELECT id, date, title FROM cards WHERE date = %s',
+        ('10-17',),
+        'cards_date_key'
+    )
+}
+
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+
+def seed(conn, count: int, inactive_ratio: float):
+    cur = conn.cursor()
+    cur.execute('TRUNCATE telegram_subscribers RESTART IDENTITY')
+    cur.execute('''
+        INSERT INTO telegram_subscribers (chat_id, username, first_name, is_active, utc_offset_minutes)
+        SELECT g, 'user' || g, 'User', random() >= %s, (ARRAY[180, 300, -300, 60])[1 + g %% 4]
+        FROM generate_series(1, %s) g
+    ''', (inactive_ratio, count))
+    cur.execute('''
+        INSERT INTO cards (date, title, message, image_url)
+        SELECT to_char(d, 'MM-DD'), 'Bench', 'Bench card', 'https://example.com/bench.jpg'
+        FROM generate_series(DATE '2024-01-01', DATE '2024-12-31', INTERVAL '1 day') d
+        ON CONFLICT (date) DO NOTHING
+    ''')
+    conn.commit()
+    
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE telegram_subscribers')
+    cur.execute('VACUUM ANALYZE cards')
+    conn.autocommit = False
+    cur.close()
+
+def iter_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from iter_nodes(child)
+
+def check_plan(conn, sql: str, params: tuple, index_name: str) -> Dict[str, Any]:
+    cur = conn.cursor()
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cur.fetchone()[0][0]['Plan']
+    conn.rollback()
+    cur.close()
+    
+    scans = [node for node in iter_nodes(plan) if 'Relation Name' in node or 'Index Name' in node]
+    used = [node for node in scans if node['Node Type'] in INDEX_SCANS and node.get('Index Name') == index_name]
+    return {
+        'nodes': [f"{node['Node Type']} {node.get('Index Name') or node.get('Relation Name')}" for node in scans],
+        'expected_index': index_name,
+        'index_only': any(node['Node Type'] == 'Index Only Scan' for node in used),
+        'ok': bool(used)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN check for the active-subscriber hot path')
+    parser.add_argument('--subscribers', type=int, default=100000)
+    parser.add_argument('--inactive-ratio', type=float, default=0.5)
+    parser.add_argument('--migrate', action='store_true', help='apply db_migrations before seeding')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        apply_migrations(conn)
+    seed(conn, args.subscribers, args.inactive_ratio)
+    
+    failed = False
+    for name, (sql, params, index_name) in QUERIES.items():
+        result = check_plan(conn, sql, params, index_name)
+        failed = failed or not result['ok']
+        print(json.dumps({'query': name, **result}))
+    
+    conn.close()
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
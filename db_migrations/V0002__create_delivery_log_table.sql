@@ -0,0 +1,11 @@
+-- Журнал доставки открыток (пишется пачками во время рассылки)
+CREATE TABLE IF NOT EXISTS delivery_log (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    card_id INTEGER NOT NULL,
+    is_sent BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_delivery_log_created_at ON delivery_log(created_at);
+CREATE INDEX IF NOT EXISTS idx_delivery_log_chat_id ON delivery_log(chat_id);
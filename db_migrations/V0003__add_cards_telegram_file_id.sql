@@ -0,0 +1,2 @@
+-- Кэш file_id картинки открытки в Telegram (заполняется после первой успешной отправки)
+ALTER TABLE cards ADD COLUMN IF NOT EXISTS telegram_file_id TEXT;
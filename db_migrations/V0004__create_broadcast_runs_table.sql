@@ -0,0 +1,14 @@
+-- Состояние рассылок: курсор по chat_id и счетчики, чтобы продолжать рассылку между вызовами
+CREATE TABLE IF NOT EXISTS broadcast_runs (
+    id SERIAL PRIMARY KEY,
+    run_key VARCHAR(128) NOT NULL UNIQUE,
+    card_id INTEGER NOT NULL,
+    cursor_chat_id BIGINT,
+    sent_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(16) NOT NULL DEFAULT 'running',
+    lease_until TIMESTAMP,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
@@ -0,0 +1,2 @@
+-- Код ошибки Telegram Bot API для неудачных доставок
+ALTER TABLE delivery_log ADD COLUMN IF NOT EXISTS error_code SMALLINT;
@@ -0,0 +1,4 @@
+-- Маркер изменения открытки (используется инкрементальным экспортом статических снимков)
+ALTER TABLE cards ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_cards_updated_at ON cards(updated_at);
@@ -0,0 +1,7 @@
+-- Обработанные webhook-обновления Telegram: повторная доставка того же update_id пропускается
+CREATE TABLE IF NOT EXISTS processed_updates (
+    update_id BIGINT PRIMARY KEY,
+    processed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_updates_processed_at ON processed_updates(processed_at);
@@ -0,0 +1,8 @@
+-- Часовой пояс подписчика (смещение от UTC в минутах, по умолчанию Москва) для рассылки волнами по местному утру
+ALTER TABLE telegram_subscribers ADD COLUMN IF NOT EXISTS utc_offset_minutes SMALLINT NOT NULL DEFAULT 180;
+
+-- Курсор волны рассылки: (utc_offset_minutes, chat_id)
+ALTER TABLE broadcast_runs ADD COLUMN IF NOT EXISTS cursor_utc_offset SMALLINT;
+
+CREATE INDEX IF NOT EXISTS idx_subscribers_active_offset
+    ON telegram_subscribers(utc_offset_minutes, chat_id) WHERE is_active = true;
@@ -0,0 +1,13 @@
+-- Общий бюджет запросов к Telegram Bot API для параллельных шардов рассылки
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    name VARCHAR(64) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    refilled_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Шардированная рассылка: родительская запись волны агрегирует счетчики шардов
+ALTER TABLE broadcast_runs ADD COLUMN IF NOT EXISTS parent_id INTEGER REFERENCES broadcast_runs(id);
+ALTER TABLE broadcast_runs ADD COLUMN IF NOT EXISTS shard_count SMALLINT;
+ALTER TABLE broadcast_runs ALTER COLUMN card_id DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_broadcast_runs_parent ON broadcast_runs(parent_id);
@@ -0,0 +1,18 @@
+-- Очередь доставки открыток: заполняется одним INSERT ... SELECT, воркеры разбирают ее через FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS delivery_queue (
+    id BIGSERIAL PRIMARY KEY,
+    delivery_date DATE NOT NULL,
+    card_id INTEGER NOT NULL,
+    chat_id BIGINT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts SMALLINT NOT NULL DEFAULT 0,
+    error_code SMALLINT,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (delivery_date, chat_id)
+);
+
+-- Строки 'sending' с истекшей арендой next_attempt_at снова доступны воркерам
+CREATE INDEX IF NOT EXISTS idx_delivery_queue_due
+    ON delivery_queue(next_attempt_at) WHERE status IN ('pending', 'sending');
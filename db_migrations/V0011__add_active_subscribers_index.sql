@@ -0,0 +1,9 @@
+-- Частичный индекс по активным подписчикам: keyset-обход по chat_id и COUNT(*) через index-only scan
+CREATE INDEX IF NOT EXISTS idx_subscribers_active_chat_id
+    ON telegram_subscribers(chat_id) WHERE is_active = true;
+
+-- Индекс по булевому флагу почти не используется планировщиком, его заменяют частичные индексы
+DROP INDEX IF EXISTS idx_subscribers_active;
+
+-- Дублирует индекс ограничения UNIQUE (date)
+DROP INDEX IF EXISTS idx_cards_date;
@@ -0,0 +1,60 @@
+-- Счетчик активных подписчиков: одна строка вместо COUNT(*) по всей таблице на каждый GET
+CREATE TABLE IF NOT EXISTS subscriber_stats (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    active_count BIGINT NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO subscriber_stats (id, active_count, reconciled_at)
+SELECT 1, COUNT(*), CURRENT_TIMESTAMP FROM telegram_subscribers WHERE is_active = true
+ON CONFLICT (id) DO NOTHING;
+
+-- Триггеры уровня оператора: массовая деактивация меняет счетчик одним UPDATE, а не построчно
+CREATE OR REPLACE FUNCTION apply_subscriber_stats_delta() RETURNS trigger AS $$
+DECLARE
+    delta BIGINT := 0;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE subscriber_stats SET active_count = 0, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        RETURN NULL;
+    END IF;
+    
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT delta + COUNT(*) INTO delta FROM new_rows WHERE is_active = true;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT delta - COUNT(*) INTO delta FROM old_rows WHERE is_active = true;
+    END IF;
+    
+    IF delta <> 0 THEN
+        UPDATE subscriber_stats
+        SET active_count = active_count + delta, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_subscriber_stats_insert ON telegram_subscribers;
+CREATE TRIGGER trg_subscriber_stats_insert
+    AFTER INSERT ON telegram_subscribers
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_subscriber_stats_delta();
+
+DROP TRIGGER IF EXISTS trg_subscriber_stats_update ON telegram_subscribers;
+CREATE TRIGGER trg_subscriber_stats_update
+    AFTER UPDATE ON telegram_subscribers
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_subscriber_stats_delta();
+
+DROP TRIGGER IF EXISTS trg_subscriber_stats_delete ON telegram_subscribers;
+CREATE TRIGGER trg_subscriber_stats_delete
+    AFTER DELETE ON telegram_subscribers
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_subscriber_stats_delta();
+
+DROP TRIGGER IF EXISTS trg_subscriber_stats_truncate ON telegram_subscribers;
+CREATE TRIGGER trg_subscriber_stats_truncate
+    AFTER TRUNCATE ON telegram_subscribers
+    FOR EACH STATEMENT EXECUTE FUNCTION apply_subscriber_stats_delta();
@@ -0,0 +1,2 @@
+-- Экспорт снимков сравнивает content-hash и больше не читает updated_at, индекс только замедляет запись открыток
+DROP INDEX IF EXISTS idx_cards_updated_at;
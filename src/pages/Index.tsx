@@ -57,6 +57,7 @@ const Index = () => {
         body: JSON.stringify({
           action: 'subscribe',
           chat_id: parseInt(chatId),
+          utc_offset_minutes: -new Date().getTimezoneOffset(),
         }),
       });
 